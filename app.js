@@ -289,12 +289,11 @@ async function updateDashboard() {
 
 async function renderRecentActivity() {
     try {
-        const response = await fetch('http://127.0.0.1:5000/sales');
+        const response = await fetch('http://127.0.0.1:5000/sales?limit=5');
         if (!response.ok) throw new Error('Failed to fetch sales');
-        const salesData = await response.json();
+        const recentSales = await response.json();
         
         const container = document.getElementById('recent-activity');
-        const recentSales = salesData.slice(-5).reverse();
         
         if (recentSales.length === 0) {
             container.innerHTML = '<p class="text-secondary">No recent activity</p>';
@@ -564,7 +563,7 @@ async function recordSale() {
 
 async function renderSalesHistory() {
     try {
-        const response = await fetch('http://127.0.0.1:5000/sales');
+        const response = await fetch('http://127.0.0.1:5000/sales?limit=20');
         if (!response.ok) throw new Error('Failed to fetch sales');
         const salesData = await response.json();
         
@@ -575,7 +574,7 @@ async function renderSalesHistory() {
             return;
         }
         
-        const html = salesData.slice(0, 20).map(sale => {
+        const html = salesData.map(sale => {
             const product = sale.inventory;
             const date = new Date(sale.timestamp);
             
@@ -666,7 +665,18 @@ async function trainMLModel() {
             const errorData = await response.json();
             throw new Error(errorData.error || 'Failed to train model');
         }
-        const result = await response.json();
+        const { status_url } = await response.json();
+        let job;
+        do {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const jobResponse = await fetch('http://127.0.0.1:5000' + status_url);
+            if (!jobResponse.ok) throw new Error('Failed to get training status');
+            job = await jobResponse.json();
+            container.innerHTML = `<div class="card"><div class="card__body"><p class="text-center">🤖 Training ML model... ${job.stage.replace('_', ' ')} (${job.rows_processed} rows)</p></div></div>`;
+        } while (job.status === 'queued' || job.status === 'running');
+        if (job.status !== 'completed') {
+            throw new Error(job.error || (job.result && job.result.error) || 'Failed to train model');
+        }
         showToast('ML model trained successfully!', 'success');
         await loadRecommendations();
     } catch (error) {
@@ -0,0 +1,242 @@
+"""Offline benchmarks for the ML pipeline stages on synthetic data.
+
+    python benchmark_pipeline.py --sizes 100x10000,5000x1000000 --output bench.json
+    python benchmark_pipeline.py --compare bench.json --threshold 0.25
+
+Each size is PRODUCTSxSALES. Every stage is timed (median of --repeats
+runs, --train-repeats for training) and its peak traced memory recorded in
+one extra run under tracemalloc; with --compare the run fails (exit status 1)
+when a stage got slower or bigger than the baseline by more than the
+threshold and by more than the spread of its timed runs in either report.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from daily_store import DailySalesStore
+from feature_store import FeatureStore
+from ml_inventory_model import InventoryMLModel, PredictionCache
+from model_registry import ModelRegistry
+
+DEFAULT_SIZES = "100x10000,1000x100000"
+HISTORY_DAYS = 365
+# Single-item predictions are timed over this many items and averaged
+PREDICT_SAMPLE = 20
+# Stages faster than this are run in loops lasting at least this long per
+# timed sample, so timer jitter does not swamp them
+MIN_SAMPLE_SECONDS = 0.2
+# Differences below this many seconds, or below the spread between a
+# stage's fastest and slowest run, are noise rather than regressions
+MIN_REGRESSION_SECONDS = 0.02
+
+
+def synthetic_data(n_products, n_sales, current_date, seed=0):
+    """Inventory rows and sale rows shaped like the tables, generated vectorized.
+
+    Sales are spread over the last HISTORY_DAYS days before ``current_date``
+    with a skewed product popularity, as real catalogs have.
+    """
+    rng = np.random.default_rng(seed)
+    unit_price = np.round(rng.uniform(1, 100, n_products), 2)
+    inventory = [
+        {
+            "id": pid,
+            "name": f"Product {pid}",
+            "sku": f"SKU-{pid:06d}",
+            "category": "Benchmark",
+            "currentstock": int(stock),
+            "minstock": int(min_stock),
+            "unitprice": float(price),
+            "supplier": "Synthetic",
+        }
+        for pid, stock, min_stock, price in zip(
+            range(1, n_products + 1),
+            rng.integers(0, 200, n_products).tolist(),
+            rng.integers(1, 20, n_products).tolist(),
+            unit_price.tolist(),
+        )
+    ]
+
+    # Zipf-like 1/rank popularity over a shuffled ranking
+    popularity = 1.0 / rng.permutation(np.arange(1, n_products + 1))
+    popularity /= popularity.sum()
+    products = rng.choice(n_products, size=n_sales, p=popularity)
+    end = np.datetime64(current_date, "s") + np.timedelta64(1, "D")
+    seconds = rng.integers(0, HISTORY_DAYS * 86400, n_sales)
+    timestamps = (end - seconds.astype("timedelta64[s]")).astype(str)
+    quantities = rng.integers(1, 6, n_sales)
+    prices = np.round(unit_price[products] * rng.uniform(0.9, 1.1, n_sales), 2)
+    sales = [
+        {"product_id": pid, "quantity": qty, "sale_price": price, "timestamp": ts}
+        for pid, qty, price, ts in zip((products + 1).tolist(), quantities.tolist(), prices.tolist(), timestamps.tolist())
+    ]
+    return inventory, sales
+
+
+def measure(stage, func, results, size, repeats=1):
+    """Median wall time of ``repeats`` runs of ``func``, then peak traced memory of one more run.
+
+    A fast stage is run in loops of at least MIN_SAMPLE_SECONDS per timed
+    sample and its time per run recorded. Tracing slows allocations down,
+    so it is kept out of the timed runs. ``spread`` (slowest minus fastest
+    sample) tells how noisy the stage is.
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        loops = math.ceil(MIN_SAMPLE_SECONDS / max(elapsed, 1e-6)) if elapsed < MIN_SAMPLE_SECONDS else 1
+        if loops == 1:
+            timings.append(elapsed)
+        while len(timings) < repeats:
+            started = time.perf_counter()
+            for _ in range(loops):
+                func()
+            timings.append((time.perf_counter() - started) / loops)
+        tracemalloc.start()
+        try:
+            value = func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    seconds = float(np.median(timings))
+    results.append({
+        "size": size, "stage": stage, "seconds": seconds, "spread": max(timings) - min(timings),
+        "peak_mb": peak / 2**20, "repeats": repeats, "loops": loops,
+    })
+    print(f"  {stage:<28}{seconds:>10.3f} s{peak / 2**20:>10.1f} MB")
+    return value
+
+
+def run_size(n_products, n_sales, seed=0, repeats=5, train_repeats=3):
+    size = f"{n_products}x{n_sales}"
+    results = []
+    registry_dir = tempfile.mkdtemp(prefix="benchmark-registry-")
+    try:
+        model = InventoryMLModel()
+        model.registry = ModelRegistry(registry_dir)
+        model.model_path = f"{registry_dir}/legacy.pkl"
+        model.feature_store = FeatureStore(f"{registry_dir}/features")
+        # Repeated runs would otherwise time cache lookups instead of inference
+        model.prediction_cache = PredictionCache(max_entries=0)
+        print(f"\n{n_products} products, {n_sales} sales")
+        inventory, sales = synthetic_data(n_products, n_sales, model.current_date(), seed=seed)
+
+        def build_store():
+            store = DailySalesStore(path=f"{registry_dir}/store.pkl")
+            store.add_sales(sales)
+            return store
+
+        store = measure("build_sales_store", build_store, results, size, repeats)
+        measure(
+            "prepare_features", lambda: model.prepare_features(sales, inventory, use_store=False), results, size, repeats
+        )
+        measure("prepare_features_stored", lambda: model.prepare_features(sales, inventory), results, size, repeats)
+        measure("train_model", lambda: model.train_model(store, inventory), results, size, train_repeats)
+        sample = inventory[:PREDICT_SAMPLE]
+
+        def predict_each():
+            for item in sample:
+                model.predict_demand(item, store)
+
+        measure("predict_demand_x%d" % len(sample), predict_each, results, size, repeats)
+        measure("predict_demand_batch", lambda: model.predict_demand_batch(inventory, store), results, size, repeats)
+        measure(
+            "generate_ml_recommendations", lambda: model.generate_ml_recommendations(inventory, store), results, size, repeats
+        )
+
+        # A rerun with nothing changed, every product a cache hit
+        model.prediction_cache = PredictionCache()
+        model.predict_demand_batch(inventory, store)
+        measure("predict_demand_batch_cached", lambda: model.predict_demand_batch(inventory, store), results, size, repeats)
+    finally:
+        shutil.rmtree(registry_dir, ignore_errors=True)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(results, baseline, threshold):
+    """Stages whose time or peak memory grew by more than ``threshold`` over the baseline."""
+    previous = {(entry["size"], entry["stage"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["size"], entry["stage"]))
+        if before is None:
+            continue
+        noise = max(MIN_REGRESSION_SECONDS, entry.get("spread", 0), before.get("spread", 0))
+        slower = entry["seconds"] - before["seconds"] > noise
+        if slower and entry["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((entry, "seconds", before["seconds"]))
+        if entry["peak_mb"] > before["peak_mb"] * (1 + threshold) and entry["peak_mb"] - before["peak_mb"] > 1:
+            regressions.append((entry, "peak_mb", before["peak_mb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ML pipeline stages on synthetic data")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated PRODUCTSxSALES sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per stage")
+    parser.add_argument("--train-repeats", type=int, default=3, help="Timed runs of the training stage")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes.split(","):
+        n_products, n_sales = (int(part) for part in size.lower().split("x"))
+        results.extend(run_size(
+            n_products, n_sales, seed=args.seed, repeats=args.repeats, train_repeats=args.train_repeats
+        ))
+
+    report = {
+        "commit": current_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        print(f"\nCompared with {args.compare} (commit {baseline.get('commit')}), threshold {args.threshold:.0%}")
+        for entry, metric, before in regressions:
+            print(f"  REGRESSION {entry['size']} {entry['stage']}: {metric} {before:.3f} -> {entry[metric]:.3f}")
+        if regressions:
+            sys.exit(1)
+        print("  No regressions")
+
+
+if __name__ == "__main__":
+    main()
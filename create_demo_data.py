@@ -1,14 +1,11 @@
-from supabase import create_client, Client
 from datetime import datetime, timedelta
 import random
-import os
 from dotenv import load_dotenv
+from storage import create_storage
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+storage = create_storage()
 
 def create_demo_data():
     """Create comprehensive demo data for ML training"""
@@ -16,11 +13,10 @@ def create_demo_data():
     
     # Clear existing sales data first
     print("Clearing existing sales data...")
-    supabase.table('sales').delete().neq('id', '00000000-0000-0000-0000-000000000000').execute()
+    storage.delete_all_sales()
     
     # Get inventory items
-    inventory_response = supabase.table('inventory').select('*').execute()
-    inventory = inventory_response.data
+    inventory = storage.list_inventory()
     
     if not inventory:
         print("No inventory items found!")
@@ -110,7 +106,7 @@ def create_demo_data():
         batch_size = 50
         for i in range(0, len(sales_data), batch_size):
             batch = sales_data[i:i + batch_size]
-            response = supabase.table('sales').insert(batch).execute()
+            storage.insert_sales(batch)
             print(f"Inserted batch {i//batch_size + 1}/{(len(sales_data) + batch_size - 1)//batch_size}")
         
         print(f"Successfully created demo data with {len(sales_data)} sales records!")
@@ -0,0 +1,259 @@
+import threading
+from datetime import datetime
+import os
+
+import numpy as np
+
+from feature_engine import DailySeries, forward_fill_prices
+
+
+def _sale_day(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return np.datetime64(timestamp.date(), "D")
+
+
+class _ProductDays:
+    """Growable per-day totals for one product, starting at its first sale day."""
+
+    __slots__ = ("first_day", "size", "quantity", "price_sum", "price_count")
+
+    def __init__(self, first_day, capacity=64):
+        self.first_day = first_day
+        self.size = 0
+        self.quantity = np.zeros(capacity)
+        self.price_sum = np.zeros(capacity)
+        self.price_count = np.zeros(capacity, dtype=np.int64)
+
+    def _resize(self, capacity, shift=0):
+        for name in ("quantity", "price_sum", "price_count"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[shift:shift + self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def slot(self, day):
+        """Index of ``day``, growing the arrays (or moving the start back) as needed."""
+        offset = int((day - self.first_day).astype(np.int64))
+        if offset < 0:
+            # A backfilled sale before the first known day.
+            self._resize(max(len(self.quantity), self.size - offset) * 2, shift=-offset)
+            self.first_day = day
+            self.size -= offset
+            offset = 0
+        if offset >= len(self.quantity):
+            self._resize(max(offset + 1, len(self.quantity) * 2))
+        self.size = max(self.size, offset + 1)
+        return offset
+
+
+class DailySalesStore:
+    """Per-product daily quantity and mean sale price, maintained incrementally.
+
+    Every sale touches one day slot, so recording it is O(1). The model reads
+    its windows from here instead of re-aggregating the raw sales history.
+
+    A store may hold only the days from ``history_start`` (an ISO date) on,
+    plus each product's first sale day; None means the full history.
+    ``last_sale_id`` is the highest sales table id folded in, where catching
+    up resumes.
+    """
+
+    def __init__(self, path='daily_sales_store.pkl'):
+        self.path = path
+        self.products = {}
+        self.sales_count = 0
+        self.last_sale_id = None
+        self.history_start = None
+        self._lock = threading.Lock()
+
+    def _product_days(self, product_id, day):
+        days = self.products.get(product_id)
+        if days is None:
+            days = self.products[product_id] = _ProductDays(day)
+        return days
+
+    def _record(self, product_id, quantity, sale_price, timestamp, sale_id=None):
+        # Converted before anything changes, so a bad value leaves the store as it was
+        day = _sale_day(timestamp)
+        quantity = float(quantity) if quantity is not None else None
+        sale_price = float(sale_price) if sale_price is not None else np.nan
+        days = self._product_days(product_id, day)
+        i = days.slot(day)
+        # A backdated sale before a partial store's days only moves the
+        # product's first day back; backfilling those days counts it
+        if self.history_start is None or day >= np.datetime64(self.history_start, "D"):
+            if quantity is not None:
+                days.quantity[i] += quantity
+            if not np.isnan(sale_price):
+                days.price_sum[i] += sale_price
+                days.price_count[i] += 1
+            self.sales_count += 1
+        if sale_id is not None and (self.last_sale_id is None or sale_id > self.last_sale_id):
+            self.last_sale_id = sale_id
+
+    def add_sale(self, product_id, quantity, sale_price, timestamp):
+        """Fold one sale into its product's day."""
+        with self._lock:
+            self._record(product_id, quantity, sale_price, timestamp)
+
+    def add_sales(self, sales_data):
+        """Fold raw sale rows (as returned by the sales table) into the store."""
+        with self._lock:
+            for sale in sales_data:
+                self._record(
+                    sale["product_id"], sale.get("quantity"), sale.get("sale_price"), sale["timestamp"], sale.get("id")
+                )
+
+    def add_daily_totals(self, rows):
+        """Fold rows pre-aggregated per product and day (see Storage.list_daily_sales) into the store.
+
+        ``last_sale_id`` is left to the caller, which knows which ids the rows cover.
+        """
+        with self._lock:
+            for row in rows:
+                day = np.datetime64(row["day"], "D")
+                days = self._product_days(row["product_id"], day)
+                i = days.slot(day)
+                days.quantity[i] += row["quantity"] or 0
+                days.price_sum[i] += row["price_sum"] or 0
+                days.price_count[i] += row["price_count"] or 0
+                self.sales_count += row["sales"]
+
+    def add_history(self, rows, history_start):
+        """Mark the store as holding only the days from ``history_start`` on.
+
+        ``rows`` (see Storage.list_sales_history) start each product at its
+        first sale day, so history lengths come out right, and keep the
+        prices of its last priced day before, which seed its windows.
+        """
+        with self._lock:
+            for row in rows:
+                first_day = np.datetime64(row["first_day"], "D")
+                days = self._product_days(row["product_id"], first_day)
+                days.slot(first_day)
+                if row["day"] is not None:
+                    i = days.slot(np.datetime64(row["day"], "D"))
+                    days.price_sum[i] = row["price_sum"]
+                    days.price_count[i] = row["price_count"]
+            self.history_start = history_start
+
+    def clear_before(self, day):
+        """Zero every product's totals before ``day`` (an ISO date), ahead of reloading them."""
+        day = np.datetime64(day, "D")
+        with self._lock:
+            for days in self.products.values():
+                stop = min(max(int((day - days.first_day).astype(np.int64)), 0), days.size)
+                days.quantity[:stop] = 0
+                days.price_sum[:stop] = 0
+                days.price_count[:stop] = 0
+
+    def clear(self):
+        with self._lock:
+            self.products = {}
+            self.sales_count = 0
+            self.last_sale_id = None
+            self.history_start = None
+
+    def rebuild(self, sales_data):
+        """Discard everything and aggregate ``sales_data`` from scratch."""
+        self.clear()
+        self.add_sales(sales_data)
+
+    def to_series(self, current_date, lookback=None):
+        """Dense DailySeries up to ``current_date``.
+
+        With ``lookback`` only the last ``lookback`` days of each product are
+        materialized, so the cost no longer depends on how long the history is.
+        Raises ValueError if those days reach back before ``history_start``.
+        In a partial store, a window that opens without sales gets its first
+        price from inside the window rather than from before it.
+        """
+        current_day = np.datetime64(current_date, "D")
+        with self._lock:
+            if self.history_start is not None and (
+                lookback is None or current_day - lookback + 1 < np.datetime64(self.history_start, "D")
+            ):
+                raise ValueError(f"The daily sales store only holds the days from {self.history_start}")
+            items = list(self.products.items())
+            history = np.array([int((current_day - d.first_day).astype(np.int64)) + 1 for _, d in items], dtype=np.int64)
+            history = np.maximum(history, 0)
+            lengths = history if lookback is None else np.minimum(history, lookback)
+            offsets = np.zeros(len(lengths), dtype=np.int64)
+            if len(lengths):
+                np.cumsum(lengths[:-1], out=offsets[1:])
+            quantity = np.zeros(int(lengths.sum()))
+            price = np.zeros(int(lengths.sum()))
+            first_days = np.empty(len(items), dtype="datetime64[D]")
+            for k, (_, days) in enumerate(items):
+                start = history[k] - lengths[k]
+                first_days[k] = days.first_day + start
+                stop = min(history[k], days.size)
+                if stop > start:
+                    out = slice(offsets[k], offsets[k] + stop - start)
+                    quantity[out] = days.quantity[start:stop]
+                    counts = days.price_count[start:stop]
+                    price[out] = np.divide(days.price_sum[start:stop], counts, out=np.zeros(stop - start), where=counts > 0)
+                if start > 0 and lengths[k] and price[offsets[k]] == 0:
+                    # Seed the window with the last price seen before it.
+                    before = min(start, days.size)
+                    earlier = np.flatnonzero((days.price_count[:before] > 0) & (days.price_sum[:before] != 0))
+                    if len(earlier):
+                        j = earlier[-1]
+                        price[offsets[k]] = days.price_sum[j] / days.price_count[j]
+        price = forward_fill_prices(price, offsets, lengths)
+        return DailySeries(
+            [pid for pid, _ in items], first_days, lengths, quantity, price, current_day, history_lengths=history
+        )
+
+    def save(self):
+        try:
+            with self._lock:
+                store_data = {
+                    "products": {
+                        pid: (d.first_day, d.quantity[:d.size].copy(), d.price_sum[:d.size].copy(), d.price_count[:d.size].copy())
+                        for pid, d in self.products.items()
+                    },
+                    "sales_count": self.sales_count,
+                    "last_sale_id": self.last_sale_id,
+                    "history_start": self.history_start,
+                }
+            import joblib
+
+            joblib.dump(store_data, self.path)
+            print(f"Daily sales store saved to {self.path}")
+        except Exception as e:
+            print(f"Error saving daily sales store: {e}")
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                import joblib
+
+                store_data = joblib.load(self.path)
+                if "last_sale_id" not in store_data:
+                    # Written before catching up by sale id; reload from the table
+                    print("Daily sales store predates sale id tracking, reloading")
+                    return False
+                products = {}
+                for pid, (first_day, quantity, price_sum, price_count) in store_data["products"].items():
+                    days = _ProductDays(first_day, capacity=max(64, len(quantity) * 2))
+                    days.size = len(quantity)
+                    days.quantity[:days.size] = quantity
+                    days.price_sum[:days.size] = price_sum
+                    days.price_count[:days.size] = price_count
+                    products[pid] = days
+                with self._lock:
+                    self.products = products
+                    self.sales_count = store_data["sales_count"]
+                    self.last_sale_id = store_data["last_sale_id"]
+                    self.history_start = store_data.get("history_start")
+                print("Daily sales store loaded successfully")
+                return True
+            return False
+        except Exception as e:
+            print(f"Error loading daily sales store: {e}")
+            return False
+
+# Global daily sales store instance
+sales_store = DailySalesStore()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge, SGDRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.preprocessing import StandardScaler
+
+from model_registry import MappedForestRegressor
+
+# Demand estimators the model can be trained with, selected by MODEL_BACKEND.
+# All of them are fitted on the same scaled feature rows; "label" is what
+# recommendations report as ml_model_used. Backends without native support
+# for multi-horizon targets get one model per horizon day.
+ESTIMATOR_BACKENDS = {
+    "random_forest": {
+        "label": "RandomForest",
+        "factory": lambda: RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1),
+    },
+    "small_forest": {
+        "label": "SmallRandomForest",
+        "factory": lambda: RandomForestRegressor(
+            n_estimators=20, max_depth=12, min_samples_leaf=2, random_state=42, n_jobs=-1
+        ),
+    },
+    "hist_gradient_boosting": {
+        "label": "HistGradientBoosting",
+        "factory": lambda: HistGradientBoostingRegressor(random_state=42),
+        "multi_output": False,
+    },
+    "ridge": {
+        "label": "Ridge",
+        "factory": lambda: Ridge(alpha=1.0),
+    },
+    # Supports partial_fit, so it can train out of core in streaming mode. The
+    # small, averaged step keeps it stable on chunks of a few products' windows
+    "sgd": {
+        "label": "SGDLinear",
+        "factory": lambda: SGDRegressor(alpha=1e-4, learning_rate="invscaling", eta0=3e-4, average=True, random_state=42),
+        "multi_output": False,
+    },
+}
+DEFAULT_BACKEND = "random_forest"
+# Tuned backend, hyperparameters and window cap written by tune_model.py
+MODEL_CONFIG_PATH = os.getenv("MODEL_CONFIG_PATH", "model_config.json")
+
+
+def make_estimator(backend, multi_output=False, params=None):
+    """A fresh, unfitted estimator for ``backend``, able to fit 2-D targets if ``multi_output``.
+
+    ``params`` override the backend's default hyperparameters.
+    """
+    if backend not in ESTIMATOR_BACKENDS:
+        raise ValueError(f"Unknown estimator backend {backend!r}; choose from {', '.join(ESTIMATOR_BACKENDS)}")
+    estimator = ESTIMATOR_BACKENDS[backend]["factory"]()
+    if params:
+        estimator.set_params(**params)
+    if multi_output and not ESTIMATOR_BACKENDS[backend].get("multi_output", True):
+        estimator = MultiOutputRegressor(estimator)
+    return estimator
+
+
+def supports_partial_fit(backend):
+    return hasattr(make_estimator(backend), "partial_fit")
+
+
+def load_model_config(path=None):
+    """The tuned model configuration, or an empty dict if none has been saved."""
+    try:
+        with open(path or MODEL_CONFIG_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Error loading model config: {e}")
+        return {}
+
+
+def save_model_config(config, path=None):
+    path = path or MODEL_CONFIG_PATH
+    staging = f"{path}.tmp"
+    with open(staging, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(staging, path)
+
+
+def backend_label(backend):
+    return ESTIMATOR_BACKENDS.get(backend, {}).get("label", backend)
+
+
+def serving_estimator(estimator):
+    """The estimator as it is served: forests are flattened like the registry stores them."""
+    if isinstance(estimator, RandomForestRegressor):
+        return MappedForestRegressor.from_forest(estimator)
+    return estimator
+
+
+def compare_backends(features, targets, backends=None, batch_size=500, repeats=5):
+    """Fit every backend on the same split and measure cost and accuracy.
+
+    Returns one dict per backend with fit time, the median latency of
+    predicting a ``batch_size``-row batch with the served estimator, the
+    pickled size and the holdout MAE and R².
+    """
+    X_train, X_test, y_train, y_test = train_test_split(features, targets, test_size=0.2, random_state=42)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    batch = X_test_scaled[np.arange(batch_size) % len(X_test_scaled)]
+
+    results = []
+    for backend in backends or ESTIMATOR_BACKENDS:
+        estimator = make_estimator(backend, multi_output=targets.ndim == 2)
+        started = time.perf_counter()
+        estimator.fit(X_train_scaled, y_train)
+        fit_seconds = time.perf_counter() - started
+
+        served = serving_estimator(estimator)
+        served.predict(batch)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            served.predict(batch)
+            timings.append(time.perf_counter() - started)
+
+        predictions = served.predict(X_test_scaled)
+        results.append({
+            "backend": backend,
+            "label": backend_label(backend),
+            "fit_seconds": fit_seconds,
+            "predict_batch_ms": float(np.median(timings)) * 1000,
+            "batch_size": batch_size,
+            "pickle_bytes": len(pickle.dumps(estimator, protocol=pickle.HIGHEST_PROTOCOL)),
+            "holdout_mae": float(mean_absolute_error(y_test, predictions)),
+            "holdout_r2": float(r2_score(y_test, predictions)),
+        })
+    return results
+
+
+def pick_backend(results, max_mae):
+    """The backend with the fastest batch prediction whose holdout MAE is within ``max_mae``."""
+    eligible = [result for result in results if result["holdout_mae"] <= max_mae]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda result: result["predict_batch_ms"])["backend"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare demand estimator backends on the current data")
+    parser.add_argument("--backends", help="Comma-separated backends (default: all)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per timed prediction batch")
+    parser.add_argument("--max-mae", type=float, help="Accuracy bar used to pick the fastest backend")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from ml_inventory_model import ml_model
+    from storage import create_storage
+
+    load_dotenv()
+    storage = create_storage()
+    inventory = storage.list_inventory()
+    sales = storage.list_sales(columns=("product_id", "quantity", "sale_price", "timestamp"))
+    features, targets = ml_model.prepare_features(sales, inventory)
+    if len(features) < 10:
+        print("Not enough training windows to compare backends")
+        return
+
+    backends = args.backends.split(",") if args.backends else None
+    results = compare_backends(features, targets, backends=backends, batch_size=args.batch_size)
+    print(f"\n{'backend':<24}{'fit s':>9}{'predict ms':>12}{'pickle KB':>11}{'MAE':>9}{'R²':>8}")
+    for result in results:
+        print(
+            f"{result['backend']:<24}{result['fit_seconds']:>9.2f}{result['predict_batch_ms']:>12.2f}"
+            f"{result['pickle_bytes'] / 1024:>11.0f}{result['holdout_mae']:>9.3f}{result['holdout_r2']:>8.3f}"
+        )
+    if args.max_mae is not None:
+        best = pick_backend(results, args.max_mae)
+        if best:
+            print(f"\nFastest backend within MAE {args.max_mae}: {best} (set MODEL_BACKEND={best})")
+        else:
+            print(f"\nNo backend meets MAE {args.max_mae}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
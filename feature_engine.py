@@ -0,0 +1,402 @@
+import hashlib
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Every feature row holds MAX_WINDOW left-padded daily quantities followed by
+# average price, weekday, month, day, current stock, min stock, unit price
+# and the window size that was used. A smaller window cap shortens the
+# windows but keeps this layout.
+MAX_WINDOW = 30
+N_FEATURES = MAX_WINDOW + 8
+MIN_HISTORY_DAYS = 7
+
+
+def adaptive_window_size(days_in_inventory, window_cap=MAX_WINDOW):
+    """Window size used for a product with the given number of days of history."""
+    return min(window_cap, max(2, round(days_in_inventory / 5)))
+
+
+class DailySeries:
+    """Dense per-day quantity and price series for many products in one buffer.
+
+    Product ``k`` owns ``quantity[offsets[k]:offsets[k] + lengths[k]]``, the
+    days ``first_days[k]`` to ``current_date`` inclusive. Missing days have
+    zero quantity and the price carried forward from the last day with sales.
+
+    A series may hold only the most recent days of each product; in that case
+    ``history_lengths`` still counts every day since the product's first sale
+    so window sizes come out the same as for the full series.
+    """
+
+    def __init__(self, product_ids, first_days, lengths, quantity, price, current_date, history_lengths=None):
+        self.product_ids = list(product_ids)
+        self.index = {pid: k for k, pid in enumerate(self.product_ids)}
+        self.first_days = np.asarray(first_days, dtype="datetime64[D]")
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.zeros(len(self.lengths), dtype=np.int64)
+        if len(self.lengths):
+            np.cumsum(self.lengths[:-1], out=self.offsets[1:])
+        self.quantity = quantity
+        self.price = price
+        self.current_date = np.datetime64(current_date, "D")
+        if history_lengths is None:
+            self.history_lengths = self.lengths
+        else:
+            self.history_lengths = np.asarray(history_lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __contains__(self, product_id):
+        return product_id in self.index
+
+    def get(self, product_id):
+        """Return ``(quantity, price)`` views for one product, or None."""
+        k = self.index.get(product_id)
+        if k is None:
+            return None
+        start, stop = self.offsets[k], self.offsets[k] + self.lengths[k]
+        return self.quantity[start:stop], self.price[start:stop]
+
+    def subset(self, product_ids):
+        """Copy of the series restricted to ``product_ids`` (unknown ids are skipped)."""
+        codes = [self.index[pid] for pid in dict.fromkeys(product_ids) if pid in self.index]
+        codes = np.array(codes, dtype=np.int64)
+        if len(codes):
+            quantity = np.concatenate([self.quantity[self.offsets[k]:self.offsets[k] + self.lengths[k]] for k in codes])
+            price = np.concatenate([self.price[self.offsets[k]:self.offsets[k] + self.lengths[k]] for k in codes])
+        else:
+            quantity, price = self.quantity[:0], self.price[:0]
+        return DailySeries(
+            [self.product_ids[k] for k in codes],
+            self.first_days[codes],
+            self.lengths[codes],
+            quantity,
+            price,
+            self.current_date,
+            history_lengths=self.history_lengths[codes],
+        )
+
+    @classmethod
+    def from_daily_totals(cls, product_codes, product_ids, days, quantity, price, first_days, current_date):
+        """Build the dense buffer from sparse per-(product, day) aggregates.
+
+        ``product_codes`` index into ``product_ids``; ``days`` must not be later
+        than ``current_date``. ``price`` holds the mean sale price for the day.
+        """
+        current_day = np.datetime64(current_date, "D")
+        first_days = np.asarray(first_days, dtype="datetime64[D]")
+        lengths = np.maximum((current_day - first_days).astype(np.int64) + 1, 0)
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        if len(lengths):
+            np.cumsum(lengths[:-1], out=offsets[1:])
+        total = int(lengths.sum())
+
+        positions = offsets[product_codes] + (days - first_days[product_codes]).astype(np.int64)
+        dense_quantity = np.zeros(total, dtype=np.asarray(quantity).dtype)
+        dense_quantity[positions] = quantity
+        dense_price = np.zeros(total, dtype=np.float64)
+        dense_price[positions] = price
+        dense_price = forward_fill_prices(dense_price, offsets, lengths)
+
+        return cls(product_ids, first_days, lengths, dense_quantity, dense_price, current_day)
+
+    @classmethod
+    def from_sales(cls, sales_data, current_date):
+        """Group raw sale rows by product and day in a single pass."""
+        current_day = np.datetime64(current_date, "D")
+        if not sales_data:
+            return cls([], [], [], np.zeros(0, dtype=np.int64), np.zeros(0), current_day)
+        import pandas as pd
+
+        df = pd.DataFrame(sales_data, columns=["product_id", "quantity", "sale_price", "timestamp"])
+        timestamps = pd.to_datetime(df["timestamp"], format="ISO8601")
+        if timestamps.dt.tz is not None:
+            timestamps = timestamps.dt.tz_localize(None)
+        df["day"] = timestamps.values.astype("datetime64[D]")
+        # Same-day prices are averaged in timestamp order, as before.
+        df = df.iloc[np.argsort(timestamps.values, kind="stable")]
+
+        # The history of a product starts at its first sale even if that sale
+        # lies after current_date; such products end up with no days at all.
+        first = df.groupby("product_id", sort=False)["day"].min()
+        df = df[df["day"] <= current_day]
+        daily = (
+            df.groupby(["product_id", "day"], sort=False)
+            .agg(quantity=("quantity", "sum"), sale_price=("sale_price", "mean"))
+            .reset_index()
+        )
+        product_ids = list(first.index)
+        product_codes = pd.Index(product_ids).get_indexer(daily["product_id"])
+        return cls.from_daily_totals(
+            product_codes,
+            product_ids,
+            daily["day"].values.astype("datetime64[D]"),
+            daily["quantity"].to_numpy(),
+            daily["sale_price"].to_numpy(dtype=np.float64, na_value=np.nan),
+            first.values.astype("datetime64[D]"),
+            current_day,
+        )
+
+
+def forward_fill_prices(price, offsets, lengths):
+    """Carry the last non-zero price forward within each product's segment.
+
+    Zero and NaN prices count as missing; anything still missing at the start
+    of a segment becomes zero.
+    """
+    price = np.where(price == 0, np.nan, price)
+    fill_from = np.arange(len(price))
+    anchors = ~np.isnan(price)
+    anchors[offsets[lengths > 0]] = True
+    fill_from[~anchors] = 0
+    np.maximum.accumulate(fill_from, out=fill_from)
+    price = price[fill_from]
+    price[np.isnan(price)] = 0
+    return price
+
+
+def _calendar(days):
+    """Weekday, month and day-of-month columns for an array of datetime64[D]."""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(days)
+    return index.weekday.to_numpy(), index.month.to_numpy(), index.day.to_numpy()
+
+
+def _row_means(block):
+    """Row means of a 2-D block, summed in the same order as numpy's 1-D sum.
+
+    A reduction along axis=1 adds the columns one after another, which can
+    differ from the pairwise summation pandas uses for ``Series.mean`` in the
+    last bit. Replaying the 8-way pairwise scheme keeps the features identical
+    to the ones produced by the original per-window loop.
+    """
+    n = block.shape[1]
+    if n < 8:
+        total = np.zeros(block.shape[0])
+        for i in range(n):
+            total += block[:, i]
+        return total / n
+    stop = n - n % 8
+    acc = block[:, :8].copy()
+    for i in range(8, stop, 8):
+        acc += block[:, i:i + 8]
+    total = ((acc[:, 0] + acc[:, 1]) + (acc[:, 2] + acc[:, 3])) + ((acc[:, 4] + acc[:, 5]) + (acc[:, 6] + acc[:, 7]))
+    for i in range(stop, n):
+        total += block[:, i]
+    return total / n
+
+
+def _item_fields(items):
+    return np.array(
+        [[item.get("currentstock", 0), item.get("minstock", 0), item.get("unitprice", 0)] for item in items],
+        dtype=np.float64,
+    ).reshape(len(items), 3)
+
+
+def _eligible_entries(series, inventory_data, window_cap=MAX_WINDOW):
+    """(position, item, product index, window size) for items with enough history."""
+    if not 2 <= window_cap <= MAX_WINDOW:
+        raise ValueError(f"window_cap must be between 2 and {MAX_WINDOW}, got {window_cap}")
+    entries = []
+    for position, item in enumerate(inventory_data):
+        k = series.index.get(item["id"])
+        if k is None or series.history_lengths[k] < MIN_HISTORY_DAYS:
+            continue
+        entries.append((position, item, k, adaptive_window_size(int(series.history_lengths[k]), window_cap)))
+    return entries
+
+
+def _fill_rows(features, series, starts, row_windows, target_days, item_fields):
+    """Write the window, calendar and item columns of every feature row."""
+    for w in np.unique(row_windows):
+        rows = np.flatnonzero(row_windows == w)
+        qty_view = sliding_window_view(series.quantity, w)
+        price_view = sliding_window_view(series.price, w)
+        features[rows, MAX_WINDOW - w:MAX_WINDOW] = qty_view[starts[rows]]
+        features[rows, MAX_WINDOW] = _row_means(price_view[starts[rows]])
+
+    weekday, month, day = _calendar(target_days)
+    features[:, MAX_WINDOW + 1] = weekday
+    features[:, MAX_WINDOW + 2] = month
+    features[:, MAX_WINDOW + 3] = day
+    features[:, MAX_WINDOW + 4:MAX_WINDOW + 7] = item_fields
+    features[:, MAX_WINDOW + 7] = row_windows
+
+
+def _window_plan(series, inventory_data, after=None, horizon=1, window_cap=MAX_WINDOW):
+    """Per-item row counts and offsets of the training windows, without building them."""
+    entries = _eligible_entries(series, inventory_data, window_cap)
+    codes = np.array([k for _, _, k, _ in entries], dtype=np.int64)
+    windows = np.array([w for _, _, _, w in entries], dtype=np.int64)
+    # First usable step of each product: its target day must follow ``after``.
+    first_steps = np.zeros(len(entries), dtype=np.int64)
+    if after is not None and len(entries):
+        days_to_after = (np.datetime64(after, "D") - series.first_days[codes]).astype(np.int64)
+        first_steps = np.maximum(days_to_after - windows + 1, 0)
+    n_rows = np.maximum(series.lengths[codes] - windows - first_steps - (horizon - 1), 0) if len(entries) else first_steps
+    row_offsets = np.zeros(len(entries), dtype=np.int64)
+    if len(entries):
+        np.cumsum(n_rows[:-1], out=row_offsets[1:])
+    return {
+        "codes": codes,
+        "windows": windows,
+        "first_steps": first_steps,
+        "row_offsets": row_offsets,
+        "item_fields": _item_fields([item for _, item, _, _ in entries]),
+        "total": int(n_rows.sum()),
+        "horizon": horizon,
+    }
+
+
+def _plan_rows(series, plan, start, stop):
+    """Entry, window start in the series buffer and target day of rows ``start:stop``."""
+    rows = np.arange(start, stop)
+    # Items without rows share their offset with the next item, so the
+    # rightmost match is the item the row belongs to.
+    row_entry = np.searchsorted(plan["row_offsets"], rows, side="right") - 1
+    # Position of each output row inside its product's series.
+    step = rows - plan["row_offsets"][row_entry] + plan["first_steps"][row_entry]
+    codes = plan["codes"][row_entry]
+    starts = series.offsets[codes] + step
+    target_days = series.first_days[codes] + (step + plan["windows"][row_entry])
+    return row_entry, starts, target_days
+
+
+def _materialize_windows(series, plan, start, stop, dtype):
+    """Features, targets and target days of rows ``start:stop`` of a window plan."""
+    horizon = plan["horizon"]
+    n = stop - start
+    features = np.zeros((n, N_FEATURES), dtype=dtype)
+    targets = np.zeros((n, horizon) if horizon > 1 else n, dtype=series.quantity.dtype)
+    target_days = np.empty(n, dtype="datetime64[D]")
+    if not n:
+        return features, targets, target_days
+    row_entry, starts, target_days = _plan_rows(series, plan, start, stop)
+    row_windows = plan["windows"][row_entry]
+
+    _fill_rows(features, series, starts, row_windows, target_days, plan["item_fields"][row_entry])
+    if horizon > 1:
+        targets[:] = series.quantity[(starts + row_windows)[:, None] + np.arange(horizon)]
+    else:
+        targets[:] = series.quantity[starts + row_windows]
+    return features, targets, target_days
+
+
+def build_training_windows(
+    series, inventory_data, after=None, with_days=False, horizon=1, dtype=np.float64, window_cap=MAX_WINDOW
+):
+    """Materialize every sliding training window for the inventory items.
+
+    Rows come out grouped per inventory item in inventory order, and within
+    an item in chronological order, exactly as the per-row loop produced.
+    ``series`` must hold each product's full history, or at least the
+    ``MAX_WINDOW`` days before the first target day wanted.
+
+    With ``after`` only windows whose target day is later than that date are
+    built. With ``with_days`` the target day of every row is returned as a
+    third array.
+
+    With ``horizon`` > 1 the targets are the quantities of the ``horizon``
+    days starting at the target day, one row of shape ``(horizon,)`` per
+    window, and only windows with all of those days in the series are built.
+
+    The feature matrix is allocated with ``dtype``; float32 halves its size
+    and is what the tree estimators compute in anyway. ``window_cap`` bounds
+    the adaptive window size.
+    """
+    plan = _window_plan(series, inventory_data, after=after, horizon=horizon, window_cap=window_cap)
+    features, targets, target_days = _materialize_windows(series, plan, 0, plan["total"], dtype)
+    if with_days:
+        return features, targets, target_days
+    return features, targets
+
+
+def count_training_windows(series, inventory_data, horizon=1, window_cap=MAX_WINDOW):
+    return _window_plan(series, inventory_data, horizon=horizon, window_cap=window_cap)["total"]
+
+
+def training_target_days(series, inventory_data, horizon=1, window_cap=MAX_WINDOW):
+    """Target day of every row of ``build_training_windows``, without building the rows."""
+    plan = _window_plan(series, inventory_data, horizon=horizon, window_cap=window_cap)
+    return _plan_rows(series, plan, 0, plan["total"])[2]
+
+
+def iter_training_windows(
+    series, inventory_data, chunk_rows, horizon=1, dtype=np.float32, rng=None, window_cap=MAX_WINDOW
+):
+    """Yield ``(first_row, features, targets)`` chunks of at most ``chunk_rows`` training windows.
+
+    ``first_row`` is the index of the chunk's first row in the full set of
+    windows; concatenated in order the chunks equal ``build_training_windows``.
+    Only one chunk is materialized at a time. With ``rng`` the chunks come
+    in a random order.
+    """
+    plan = _window_plan(series, inventory_data, horizon=horizon, window_cap=window_cap)
+    starts = np.arange(0, plan["total"], chunk_rows)
+    if rng is not None:
+        starts = rng.permutation(starts)
+    for start in starts.tolist():
+        features, targets, _ = _materialize_windows(series, plan, start, min(start + chunk_rows, plan["total"]), dtype)
+        yield start, features, targets
+
+
+def _latest_windows(series, entries):
+    """Start offsets and sizes of each entry's most recent window, plus its item fields."""
+    codes = np.array([k for _, _, k, _ in entries], dtype=np.int64)
+    row_windows = np.array([w for _, _, _, w in entries], dtype=np.int64)
+    starts = series.offsets[codes] + series.lengths[codes] - row_windows
+    return starts, row_windows, _item_fields([item for _, item, _, _ in entries])
+
+
+def build_prediction_rows(series, inventory_data, window_cap=MAX_WINDOW):
+    """One feature row per item predicting the day after ``current_date``.
+
+    Each row uses the item's most recent window. Returns the feature matrix
+    and the positions in ``inventory_data`` the rows belong to; items without
+    enough history are left out.
+    """
+    entries = _eligible_entries(series, inventory_data, window_cap)
+    positions = np.array([position for position, _, _, _ in entries], dtype=np.int64)
+    features = np.zeros((len(entries), N_FEATURES), dtype=np.float64)
+    if not entries:
+        return features, positions
+
+    starts, row_windows, item_fields = _latest_windows(series, entries)
+    target_days = np.full(len(entries), series.current_date + 1)
+    _fill_rows(features, series, starts, row_windows, target_days, item_fields)
+    return features, positions
+
+
+def prediction_fingerprints(series, inventory_data, window_cap=MAX_WINDOW):
+    """A digest of everything each item's prediction row is built from.
+
+    Covers the target day, the window size, the window's daily quantities
+    and prices and the item's stock and price fields, so two equal digests
+    mean equal feature rows. Returns the positions in ``inventory_data``, as
+    ``build_prediction_rows`` does, and one 16-byte digest per position.
+    """
+    entries = _eligible_entries(series, inventory_data, window_cap)
+    positions = np.array([position for position, _, _, _ in entries], dtype=np.int64)
+    fingerprints = [None] * len(entries)
+    if not entries:
+        return positions, fingerprints
+
+    starts, row_windows, item_fields = _latest_windows(series, entries)
+    target_day = str(series.current_date + 1).encode()
+    for w in np.unique(row_windows):
+        rows = np.flatnonzero(row_windows == w)
+        block = np.concatenate(
+            [
+                np.full((len(rows), 1), w, dtype=np.float64),
+                sliding_window_view(series.quantity, w)[starts[rows]].astype(np.float64),
+                sliding_window_view(series.price, w)[starts[rows]].astype(np.float64),
+                item_fields[rows],
+            ],
+            axis=1,
+        )
+        for row, values in zip(rows.tolist(), block):
+            fingerprints[row] = hashlib.blake2b(target_day + values.tobytes(), digest_size=16).digest()
+    return positions, fingerprints
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from feature_engine import MAX_WINDOW, MIN_HISTORY_DAYS, N_FEATURES
+
+# Bump when the feature layout or window rules change so old entries miss
+FEATURE_LAYOUT_VERSION = 1
+
+
+def training_data_key(series, inventory_data, horizon=1, window_cap=MAX_WINDOW):
+    """Hash of everything training windows are built from.
+
+    Covers the daily series (ids, dates, quantities, prices), the inventory
+    fields that end up in the rows and the window parameters, so a key only
+    matches when the windows would come out identical.
+    """
+    digest = hashlib.sha256()
+    layout = [FEATURE_LAYOUT_VERSION, MAX_WINDOW, N_FEATURES, MIN_HISTORY_DAYS, horizon, window_cap, str(series.current_date)]
+    digest.update(json.dumps(layout).encode())
+    digest.update(json.dumps(series.product_ids, default=str).encode())
+    for array in (series.first_days, series.lengths, series.history_lengths, series.quantity, series.price):
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(array)
+    items = [
+        [item["id"], item.get("currentstock", 0), item.get("minstock", 0), item.get("unitprice", 0)]
+        for item in inventory_data
+    ]
+    digest.update(json.dumps(items, default=str).encode())
+    return digest.hexdigest()[:24]
+
+
+class FeatureStore:
+    """Training windows saved as ``.npy`` files, one directory per data key.
+
+    Entries are written to a staging directory and renamed into place, and
+    read back with ``np.load(mmap_mode='r')`` so training on unchanged data
+    neither rebuilds nor copies the feature matrix. Only the ``keep`` most
+    recently used entries are kept.
+    """
+
+    def __init__(self, root='feature_store', keep=3):
+        self.root = root
+        self.keep = keep
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        """``(features, targets)`` memory-mapped, or None if ``key`` is not stored."""
+        directory = self._entry_dir(key)
+        try:
+            features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+            targets = np.load(os.path.join(directory, 'targets.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        os.utime(directory)
+        return features, targets
+
+    def save(self, key, features, targets):
+        """Store an entry and return it memory-mapped from disk."""
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            np.save(os.path.join(staging, 'features.npy'), features)
+            np.save(os.path.join(staging, 'targets.npy'), targets)
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump({'rows': len(features), 'features_dtype': str(features.dtype)}, f)
+            if os.path.exists(self._entry_dir(key)):
+                shutil.rmtree(staging)
+            else:
+                os.replace(staging, self._entry_dir(key))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self._prune()
+        return self.load(key)
+
+    def _prune(self):
+        entries = [
+            os.path.join(self.root, name) for name in os.listdir(self.root)
+            if not name.startswith('.') and os.path.isdir(os.path.join(self.root, name))
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for directory in entries[self.keep:]:
+            shutil.rmtree(directory, ignore_errors=True)
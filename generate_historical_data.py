@@ -1,13 +1,10 @@
-from supabase import create_client, Client
 from datetime import datetime, timedelta
 import random
-import os
 from dotenv import load_dotenv
+from storage import create_storage
 
 load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+storage = create_storage()
 
 def generate_historical_sales():
     """
@@ -15,8 +12,7 @@ def generate_historical_sales():
     """
     print("Generating historical sales data...")
 
-    inventory_response = supabase.table('inventory').select('*').execute()
-    inventory = inventory_response.data
+    inventory = storage.list_inventory()
 
     if not inventory:
         print("No inventory items found!")
@@ -53,8 +49,7 @@ def generate_historical_sales():
 
     if historical_sales:
         print(f"Inserting {len(historical_sales)} historical sales...")
-        response = supabase.table('sales').insert(historical_sales).execute()
-        num_inserted = len(getattr(response, 'data', []))
+        num_inserted = len(storage.insert_sales(historical_sales))
         print(f"Successfully inserted {num_inserted} historical sales!")
     else:
         print("No historical sales to insert.")
@@ -3,82 +3,298 @@ import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
-from datetime import datetime, timedelta
+from sklearn.metrics import r2_score
+from datetime import datetime
 import joblib
+from joblib import Parallel, delayed
 import os
+import threading
+from collections import OrderedDict
+import time
+from feature_engine import (
+    MAX_WINDOW,
+    DailySeries,
+    build_prediction_rows,
+    build_training_windows,
+    count_training_windows,
+    iter_training_windows,
+    prediction_fingerprints,
+)
+from daily_store import DailySalesStore
+from model_registry import MappedForestRegressor, ModelRegistry
+from feature_store import FeatureStore, training_data_key
+from estimators import DEFAULT_BACKEND, backend_label, load_model_config, make_estimator, supports_partial_fit
+from metrics import ML_STAGE_SECONDS, REGISTRY
+
+# Incremental runs fit this many new trees on the recent-window buffer and
+# append them to the active forest, dropping the oldest to keep its size
+INCREMENTAL_TREES = int(os.getenv("INCREMENTAL_TREES", "10"))
+RECENT_BUFFER_DAYS = int(os.getenv("RECENT_BUFFER_DAYS", "28"))
+# Days forecast directly by one model call; 1 trains the single-day model
+FORECAST_HORIZON = int(os.getenv("FORECAST_HORIZON", "7"))
+# Streaming (out-of-core) training: windows per chunk, passes over the data
+# and the backend used when MODEL_BACKEND cannot partial_fit
+TRAINING_CHUNK_ROWS = int(os.getenv("TRAINING_CHUNK_ROWS", "50000"))
+STREAMING_EPOCHS = int(os.getenv("STREAMING_EPOCHS", "5"))
+STREAMING_BACKEND = "sgd"
+# Every HOLDOUT_EVERY-th window is held out for the streaming test score
+HOLDOUT_EVERY = 5
+
+# Forecast curves kept by the prediction cache; 0 disables it
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "100000"))
+PREDICTION_CACHE_LOOKUPS = REGISTRY.counter(
+    "stocksense_prediction_cache_lookups_total", "Prediction cache lookups by result.", ["result"]
+)
+
+# Below this many items per shard, process start-up costs more than it saves
+MIN_ITEMS_PER_SHARD = 2000
+
+def _product_shards(inventory_data, n_jobs):
+    """Split the inventory into up to ``n_jobs`` contiguous shards."""
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    n_shards = max(1, min(n_jobs, len(inventory_data) // MIN_ITEMS_PER_SHARD))
+    size = -(-len(inventory_data) // n_shards) if inventory_data else 0
+    return [inventory_data[i:i + size] for i in range(0, len(inventory_data), size)] if size else [inventory_data]
+
+class _StreamingR2:
+    """R² (averaged over outputs) accumulated over chunks of targets and predictions."""
 
-class InventoryMLModel:
     def __init__(self):
-        self.demand_model = RandomForestRegressor(n_estimators=100, random_state=42)
+        self.n = 0
+        self.sum = self.sum_squares = self.squared_error = 0.0
+
+    def update(self, targets, predicted):
+        targets = targets.reshape(len(targets), -1)
+        predicted = predicted.reshape(len(predicted), -1)
+        self.n += len(targets)
+        self.sum = self.sum + targets.sum(axis=0)
+        self.sum_squares = self.sum_squares + (targets ** 2).sum(axis=0)
+        self.squared_error = self.squared_error + ((targets - predicted) ** 2).sum(axis=0)
+
+    def score(self):
+        if not self.n:
+            return 0.0
+        total = np.atleast_1d(self.sum_squares - self.sum ** 2 / self.n)
+        error = np.atleast_1d(self.squared_error)
+        return float(np.mean(np.where(total > 0, 1 - error / np.where(total > 0, total, 1), 0.0)))
+
+class PredictionCache:
+    """Bounded LRU cache of per-product forecast curves.
+
+    Keys are (model version, product id, fingerprint of the product's
+    prediction inputs), so a sale, a stock change or a new model version
+    simply misses; stale entries age out instead of being invalidated.
+    """
+
+    def __init__(self, max_entries=PREDICTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_lookup = None
+
+    def get_many(self, keys):
+        """Cached curves for ``keys``, None for the misses."""
+        found = []
+        hits = 0
+        with self._lock:
+            for key in keys:
+                curve = self._entries.get(key)
+                if curve is not None:
+                    self._entries.move_to_end(key)
+                    hits += 1
+                found.append(curve)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            self.last_lookup = {"items": len(keys), "hits": hits, "misses": len(keys) - hits}
+        PREDICTION_CACHE_LOOKUPS.inc("hit", amount=hits)
+        PREDICTION_CACHE_LOOKUPS.inc("miss", amount=len(keys) - hits)
+        return found
+
+    def put_many(self, keys, curves):
+        with self._lock:
+            for key, curve in zip(keys, curves):
+                self._entries[key] = curve
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                # The most recent forecast: its misses are the products recomputed
+                "last_lookup": self.last_lookup,
+            }
+
+class InventoryMLModel:
+    def __init__(self, backend=None, horizon=None, config=None):
+        # Configuration saved by tune_model.py; its hyperparameters and
+        # window cap apply when training the backend they were tuned for
+        config = load_model_config() if config is None else config
+        # Estimator trained by train_model, see estimators.ESTIMATOR_BACKENDS
+        self.backend = backend or os.getenv("MODEL_BACKEND") or config.get("backend") or DEFAULT_BACKEND
+        tuned = config.get("backend") == self.backend
+        self.estimator_params = config.get("params", {}) if tuned else {}
+        self.window_cap = config.get("window_cap", MAX_WINDOW) if tuned else MAX_WINDOW
+        # Horizon the next training run targets; model_horizon is the loaded model's
+        self.horizon = horizon or FORECAST_HORIZON
+        self.demand_model = make_estimator(self.backend, params=self.estimator_params)
         self.scaler = StandardScaler()
         self.is_trained = False
+        self.model_horizon = 1
+        self.model_window_cap = MAX_WINDOW
+        # Legacy single-file model, imported into the registry if nothing is active yet
         self.model_path = 'inventory_ml_model.pkl'
+        self.registry = ModelRegistry(
+            os.getenv("MODEL_REGISTRY_DIR", "model_registry"), keep=int(os.getenv("MODEL_REGISTRY_KEEP", "5"))
+        )
+        self.registry_poll_interval = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5"))
+        # Training windows of recent runs, keyed by a hash of their source data
+        self.feature_store = FeatureStore(os.getenv("FEATURE_STORE_DIR", "feature_store"))
+        self.version = None
+        self.version_meta = {}
+        # Version the in-memory model was published as; None while a freshly
+        # trained model is not yet, so its forecasts bypass the cache
+        self.prediction_version = None
+        self.loaded_at = None
+        self._active_mtime = None
+        self._checked_at = 0.0
+        self._swap_lock = threading.Lock()
+        # Forecasts of products whose inputs did not change since the last run
+        self.prediction_cache = PredictionCache()
 
-    def prepare_features(self, sales_data, inventory_data):
+    def current_date(self):
         # Set fixed current date for all time series (edit as needed)
-        current_date = pd.to_datetime('2025-07-29').date()
-        features = []
-        targets = []
+        return pd.to_datetime('2025-07-29').date()
+
+    def prediction_history_start(self):
+        """First day (ISO date) predictions read: the longest window back from the current date."""
+        return str(np.datetime64(self.current_date(), "D") - MAX_WINDOW + 1)
+
+    @ML_STAGE_SECONDS.time('daily_series')
+    def daily_series(self, sales_data, lookback=None):
+        """Daily series from raw sale rows or from a DailySalesStore.
+
+        A store only materializes the last ``lookback`` days per product.
+        """
+        current_date = self.current_date()
+        if isinstance(sales_data, DailySalesStore):
+            return sales_data.to_series(current_date, lookback=lookback)
+        return DailySeries.from_sales(sales_data, current_date)
 
+    @ML_STAGE_SECONDS.time('prepare_features')
+    def prepare_features(
+        self, sales_data, inventory_data, n_jobs=1, progress=None, horizon=None, use_store=True, window_cap=None
+    ):
+        """Training windows for all items, built across ``n_jobs`` processes by product shard.
+
+        Targets hold the next ``horizon`` days (default ``self.horizon``) per
+        window and features are float32. ``progress(stage, rows_processed)``
+        is called as shards complete. With ``use_store`` the windows are
+        looked up in (or saved to) the feature store by a hash of the daily
+        series and inventory, and returned memory-mapped. ``window_cap``
+        defaults to ``self.window_cap``.
+        """
+        horizon = horizon or self.horizon
+        window_cap = window_cap or self.window_cap
         print(f"Preparing features for {len(inventory_data)} inventory items (adaptive window size)...")
-        for item in inventory_data:
-            item_id = item["id"]
-            item_sales = [s for s in sales_data if s["product_id"] == item_id]
-            if not item_sales:
-                continue
-            df = pd.DataFrame(item_sales)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            df = df.sort_values("timestamp")
-            first_day = df["timestamp"].dt.date.min()
-            date_range = pd.date_range(start=first_day, end=current_date, freq="D")
-            daily_sales = (
-                df.groupby(df["timestamp"].dt.date)
-                .agg({"quantity": "sum", "sale_price": "mean"})
-                .reindex(date_range.date, fill_value=0)
-                .reset_index()
+        series = self.daily_series(sales_data)
+        key = None
+        if use_store and self.feature_store is not None:
+            key = training_data_key(series, inventory_data, horizon, window_cap)
+            stored = self.feature_store.load(key)
+            if stored is not None:
+                features, targets = stored
+                print(f"Loaded {len(features)} stored training windows ({key})")
+                if progress:
+                    progress("preparing_features", len(features))
+                return features, targets
+        shards = _product_shards(inventory_data, n_jobs)
+        if len(shards) <= 1:
+            features, targets = build_training_windows(
+                series, inventory_data, horizon=horizon, dtype=np.float32, window_cap=window_cap
             )
-            # Robustly ensure first column is always named 'date'
-            first_col = daily_sales.columns[0]
-            if first_col != "date":
-                daily_sales.rename(columns={first_col: "date"}, inplace=True)
-            daily_sales["sale_price"] = daily_sales["sale_price"].replace(0, np.nan)
-            daily_sales["sale_price"] = daily_sales["sale_price"].ffill().fillna(0)
-            days_in_inventory = len(daily_sales)
-            if days_in_inventory < 7:
-                continue
-            window_size = min(30, max(2, round(days_in_inventory / 5)))
-            print(f"Product {item.get('name', str(item_id))}: {days_in_inventory} days in inventory, window size {window_size}")
-            for i in range(len(daily_sales) - window_size):
-                win = daily_sales.iloc[i : i + window_size]
-                # Pad LEFT with zeros to always get length 30
-                sales_window = win['quantity'].values
-                pad_len = 30 - window_size
-                padded_sales = np.pad(sales_window, (pad_len, 0), 'constant')
-                feature_row = list(padded_sales)
-                feature_row.append(win['sale_price'].mean())
-                # Features for the prediction day
-                target_idx = i + window_size
-                target_day = pd.to_datetime(daily_sales["date"].iloc[target_idx])
-                feature_row.append(target_day.weekday())
-                feature_row.append(target_day.month)
-                feature_row.append(target_day.day)
-                feature_row.append(item.get("currentstock", 0))
-                feature_row.append(item.get("minstock", 0))
-                feature_row.append(item.get("unitprice", 0))
-                feature_row.append(window_size)
-                target = daily_sales["quantity"].iloc[target_idx]
-                features.append(feature_row)
-                targets.append(target)
-            print(f"  - Generated {len(daily_sales) - window_size} training samples.")
-
+            if progress:
+                progress("preparing_features", len(features))
+        else:
+            # Shards are contiguous slices of the inventory, so concatenating
+            # their results keeps the single-process row order
+            tasks = (
+                delayed(build_training_windows)(
+                    series.subset([item["id"] for item in shard]), shard,
+                    horizon=horizon, dtype=np.float32, window_cap=window_cap,
+                )
+                for shard in shards
+            )
+            parts = []
+            rows_processed = 0
+            for part in Parallel(n_jobs=len(shards), return_as="generator")(tasks):
+                parts.append(part)
+                rows_processed += len(part[0])
+                if progress:
+                    progress("preparing_features", rows_processed)
+            features = np.concatenate([part[0] for part in parts])
+            targets = np.concatenate([part[1] for part in parts])
         print(f"Total features generated: {len(features)}")
-        return np.array(features), np.array(targets)
+        if key is not None:
+            try:
+                features, targets = self.feature_store.save(key, features, targets)
+            except OSError as e:
+                print(f"Error saving training windows to the feature store: {e}")
+        return features, targets
+
+    @ML_STAGE_SECONDS.time('recent_windows')
+    def recent_windows(self, sales_data, inventory_data, after, horizon=None, window_cap=None):
+        """Training windows (features, targets, target days) for target days after ``after``.
 
-    def train_model(self, sales_data, inventory_data):
-        """Train the ML model with adaptive, per-product window size."""
+        Only the days those windows need are materialized from a store.
+        """
+        horizon = horizon or self.horizon
+        window_cap = window_cap or self.window_cap
+        current_day = np.datetime64(self.current_date(), "D")
+        lookback = max(int((current_day - np.datetime64(after, "D")).astype(np.int64)), 0) + MAX_WINDOW
+        series = self.daily_series(sales_data, lookback=lookback)
+        return build_training_windows(
+            series, inventory_data, after=after, with_days=True, horizon=horizon, dtype=np.float32,
+            window_cap=window_cap,
+        )
+
+    def train_model(self, sales_data, inventory_data, n_jobs=None, progress=None, incremental=False, streaming=False):
+        """Train the ML model with adaptive, per-product window size.
+
+        ``n_jobs`` processes build the features (default FEATURE_WORKERS or all
+        cores) and the estimator of ``self.backend`` is fitted on them (forests
+        on all cores). ``progress(stage, rows_processed)`` is called at each stage.
+
+        With ``incremental`` only the days since the active version was trained
+        are turned into windows and new trees are appended to its forest (see
+        ``train_incremental``); without a suitable active version this falls
+        back to a full retrain. With ``streaming`` the model is trained out of
+        core (see ``train_streaming``).
+        """
+        if streaming:
+            return self.train_streaming(sales_data, inventory_data, progress=progress)
+        if incremental:
+            result = self.train_incremental(sales_data, inventory_data, progress=progress)
+            if result is not None:
+                return result
+            print("No incrementally trainable model is active, running a full retrain")
         try:
             print("Starting ML model training (adaptive window)...")
-            features, targets = self.prepare_features(sales_data, inventory_data)
+            if n_jobs is None:
+                n_jobs = int(os.getenv("FEATURE_WORKERS", "0")) or os.cpu_count() or 1
+            features, targets = self.prepare_features(sales_data, inventory_data, n_jobs=n_jobs, progress=progress)
             print(f"Prepared features shape: {features.shape}")
             print(f"Prepared targets shape: {targets.shape}")
             if len(features) < 3:
@@ -87,16 +303,46 @@ class InventoryMLModel:
             X_train, X_test, y_train, y_test = train_test_split(
                 features, targets, test_size=0.2, random_state=42
             )
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
-            self.demand_model.fit(X_train_scaled, y_train)
-            train_score = self.demand_model.score(X_train_scaled, y_train)
-            test_score = self.demand_model.score(X_test_scaled, y_test)
+            if progress:
+                progress("fitting", len(features))
+            # Fit fresh objects so predictions keep using the active model meanwhile
+            demand_model = make_estimator(self.backend, multi_output=self.horizon > 1, params=self.estimator_params)
+            scaler = StandardScaler()
+            X_train_scaled = scaler.fit_transform(X_train)
+            X_test_scaled = scaler.transform(X_test)
+            with ML_STAGE_SECONDS.time('fit'):
+                demand_model.fit(X_train_scaled, y_train)
+            train_score = demand_model.score(X_train_scaled, y_train)
+            test_score = demand_model.score(X_test_scaled, y_test)
             print(f"Model trained successfully!")
             print(f"Training R² score: {train_score:.3f}")
             print(f"Test R² score: {test_score:.3f}")
-            self.is_trained = True
-            self.save_model()
+            with self._swap_lock:
+                self.demand_model = demand_model
+                self.scaler = scaler
+                self.is_trained = True
+                self.model_horizon = self.horizon
+                self.model_window_cap = self.window_cap
+                self.prediction_version = None
+            if progress:
+                progress("saving", len(features))
+            # Seed the buffer later incremental runs refit new trees on
+            current_day = np.datetime64(self.current_date(), "D")
+            buffer = self.recent_windows(sales_data, inventory_data, current_day - RECENT_BUFFER_DAYS)
+            self.save_model(
+                metadata={
+                    "train_score": train_score,
+                    "test_score": test_score,
+                    "samples": len(features),
+                    "training_mode": "full",
+                    "backend": self.backend,
+                    "horizon": self.horizon,
+                    "window_cap": self.window_cap,
+                    "estimator_params": self.estimator_params,
+                    "trained_through": str(current_day),
+                },
+                buffer=buffer,
+            )
             return True
         except Exception as e:
             print(f"Error training model: {e}")
@@ -104,66 +350,277 @@ class InventoryMLModel:
             traceback.print_exc()
             return False
 
+    @ML_STAGE_SECONDS.time('train_streaming')
+    def train_streaming(self, sales_data, inventory_data, chunk_rows=None, epochs=None, progress=None):
+        """Out-of-core training on chunks of windows produced by a generator.
+
+        Peak memory is set by ``chunk_rows`` (default TRAINING_CHUNK_ROWS),
+        not by the number of windows: one pass fits the scaler with
+        ``partial_fit``, ``epochs`` passes over the chunks in random order feed
+        the estimator's ``partial_fit`` and a last pass scores it. Uses
+        ``self.backend`` if it supports ``partial_fit``, STREAMING_BACKEND
+        otherwise.
+        """
+        try:
+            backend = self.backend if supports_partial_fit(self.backend) else STREAMING_BACKEND
+            chunk_rows = chunk_rows or TRAINING_CHUNK_ROWS
+            epochs = epochs or STREAMING_EPOCHS
+            horizon = self.horizon
+            params = self.estimator_params if backend == self.backend else {}
+            window_cap = self.window_cap
+            print(f"Starting streaming training ({backend}, {chunk_rows} windows per chunk)...")
+            series = self.daily_series(sales_data)
+            total = count_training_windows(series, inventory_data, horizon, window_cap)
+            print(f"Training windows: {total}")
+            if total < 3:
+                print("Insufficient data for training. Need at least 3 samples.")
+                return False
+
+            def chunks(rng=None):
+                for first_row, features, targets in iter_training_windows(
+                    series, inventory_data, chunk_rows, horizon=horizon, rng=rng, window_cap=window_cap
+                ):
+                    test = (np.arange(first_row, first_row + len(features)) % HOLDOUT_EVERY) == 0
+                    yield features, np.asarray(targets, dtype=np.float64), test
+
+            scaler = StandardScaler()
+            rows_processed = 0
+            for features, _, test in chunks():
+                if (~test).any():
+                    scaler.partial_fit(features[~test])
+                rows_processed += len(features)
+                if progress:
+                    progress("preparing_features", rows_processed)
+
+            demand_model = make_estimator(backend, multi_output=horizon > 1, params=params)
+            rng = np.random.default_rng(42)
+            for epoch in range(epochs):
+                rows_processed = 0
+                for features, targets, test in chunks(rng):
+                    shuffled = rng.permutation(np.flatnonzero(~test))
+                    if len(shuffled):
+                        demand_model.partial_fit(scaler.transform(features[shuffled]), targets[shuffled])
+                    rows_processed += len(features)
+                    if progress:
+                        progress(f"fitting (epoch {epoch + 1}/{epochs})", rows_processed)
+
+            train_r2, test_r2 = _StreamingR2(), _StreamingR2()
+            for features, targets, test in chunks():
+                predicted = demand_model.predict(scaler.transform(features))
+                train_r2.update(targets[~test], predicted[~test])
+                test_r2.update(targets[test], predicted[test])
+            train_score, test_score = train_r2.score(), test_r2.score()
+            print(f"Model trained successfully!")
+            print(f"Training R² score: {train_score:.3f}")
+            print(f"Test R² score: {test_score:.3f}")
+            with self._swap_lock:
+                self.demand_model = demand_model
+                self.scaler = scaler
+                self.is_trained = True
+                self.model_horizon = horizon
+                self.model_window_cap = window_cap
+                self.prediction_version = None
+            if progress:
+                progress("saving", total)
+            self.save_model(metadata={
+                "train_score": train_score,
+                "test_score": test_score,
+                "samples": total,
+                "training_mode": "streaming",
+                "backend": backend,
+                "horizon": horizon,
+                "window_cap": window_cap,
+                "estimator_params": params,
+                "trained_through": str(np.datetime64(self.current_date(), "D")),
+                "chunk_rows": chunk_rows,
+                "epochs": epochs,
+            })
+            return True
+        except Exception as e:
+            print(f"Error in streaming training: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    @ML_STAGE_SECONDS.time('train_incremental')
+    def train_incremental(self, sales_data, inventory_data, progress=None):
+        """Append trees fitted on recent windows to the active forest.
+
+        Windows are built only for target days after the active version's
+        ``trained_through`` date and added to its buffer of the last
+        RECENT_BUFFER_DAYS days of windows. INCREMENTAL_TREES new trees are fitted on
+        that buffer with the active scaler, so the cost depends on the new
+        data and the buffer size, not on the length of the history. Returns
+        None when there is no active forest with a buffer to extend.
+        """
+        self.refresh()
+        with self._swap_lock:
+            demand_model, scaler = self.demand_model, self.scaler
+            version, meta = self.version, self.version_meta
+        trained_through = meta.get("trained_through")
+        if not self.is_trained or version is None or trained_through is None:
+            return None
+        # New trees come from the active version's backend, which must be a
+        # forest, and keep its hyperparameters, horizon and window cap
+        backend = meta.get("backend", DEFAULT_BACKEND)
+        horizon = meta.get("horizon", 1)
+        window_cap = meta.get("window_cap", MAX_WINDOW)
+        params = meta.get("estimator_params", {})
+        new_trees = make_estimator(backend, multi_output=horizon > 1, params=params)
+        if not isinstance(new_trees, RandomForestRegressor) or horizon != self.horizon:
+            return None
+        if isinstance(demand_model, RandomForestRegressor):
+            demand_model = MappedForestRegressor.from_forest(demand_model)
+        elif not isinstance(demand_model, MappedForestRegressor):
+            return None
+        buffer_features = self.registry.load_array(version, "buffer_features")
+        if buffer_features is None:
+            return None
+        try:
+            print(f"Starting incremental training from {trained_through}...")
+            current_day = np.datetime64(self.current_date(), "D")
+            trained_through = np.datetime64(trained_through, "D")
+            if current_day <= trained_through:
+                print("Model is already trained through the current date")
+                return True
+            # Windows whose last target day was still in the future last time
+            features, targets, days = self.recent_windows(
+                sales_data, inventory_data, trained_through - (horizon - 1), horizon=horizon, window_cap=window_cap
+            )
+            if progress:
+                progress("preparing_features", len(features))
+            print(f"New windows since {trained_through}: {len(features)}")
+
+            # Age the buffer out and append the new windows
+            keep = np.asarray(self.registry.load_array(version, "buffer_days")) > current_day - RECENT_BUFFER_DAYS
+            buffer_features = np.concatenate([np.asarray(buffer_features)[keep], features])
+            buffer_targets = np.concatenate([np.asarray(self.registry.load_array(version, "buffer_targets"))[keep], targets])
+            buffer_days = np.concatenate([np.asarray(self.registry.load_array(version, "buffer_days"))[keep], days])
+            if len(buffer_features) < 3:
+                print("Insufficient data for incremental training. Need at least 3 samples.")
+                return False
+            if progress:
+                progress("fitting", len(buffer_features))
+            # The existing trees split on scaled features, so the scaler stays as is
+            new_trees.set_params(n_estimators=INCREMENTAL_TREES)
+            with ML_STAGE_SECONDS.time('fit'):
+                new_trees.fit(scaler.transform(buffer_features), buffer_targets)
+            combined = MappedForestRegressor.combine(
+                [demand_model, MappedForestRegressor.from_forest(new_trees)], max_estimators=demand_model.n_estimators
+            )
+            metadata = {
+                "samples": len(features),
+                "buffer_samples": len(buffer_features),
+                "training_mode": "incremental",
+                "trained_through": str(current_day),
+                "parent_version": version,
+                "backend": backend,
+                "horizon": horizon,
+                "window_cap": window_cap,
+                "estimator_params": params,
+                "estimator": meta.get("estimator", "RandomForestRegressor"),
+            }
+            if len(features):
+                metadata["new_data_score"] = float(r2_score(targets, combined.predict(scaler.transform(features))))
+                print(f"R² score on new windows: {metadata['new_data_score']:.3f}")
+            with self._swap_lock:
+                self.demand_model = combined
+                self.prediction_version = None
+            if progress:
+                progress("saving", len(buffer_features))
+            self.save_model(metadata=metadata, buffer=(buffer_features, buffer_targets, buffer_days))
+            return True
+        except Exception as e:
+            print(f"Error in incremental training: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
     def predict_demand(self, item, sales_history, days_ahead=7):
         """Predict demand for next N days for single item using adaptive window."""
-        if not self.is_trained:
-            return 0
+        return float(self.predict_demand_batch([item], sales_history, days_ahead)[0])
+
+    @ML_STAGE_SECONDS.time('forecast_batch')
+    def forecast_batch(self, inventory_data, sales_history):
+        """Per-day demand forecasts for every item with one scaler and model call.
+
+        ``sales_history`` is either raw sale rows or a DailySalesStore. Returns
+        an array of shape ``(len(inventory_data), horizon)`` whose columns are
+        the days after the current date, ``horizon`` being the one the active
+        model was trained for (1 for single-day models). Items without enough
+        history (or an untrained model) get zeros.
+
+        Curves of items whose window and stock fields are unchanged for the
+        active version come from the prediction cache; only the rest have
+        feature rows built and go through the model.
+        """
+        self.refresh()
+        with self._swap_lock:
+            scaler, demand_model, version = self.scaler, self.demand_model, self.prediction_version
+            horizon, window_cap = self.model_horizon, self.model_window_cap
+        curves = np.zeros((len(inventory_data), horizon))
+        if not self.is_trained or not inventory_data:
+            return curves
         try:
-            item_sales = [s for s in sales_history if s["product_id"] == item["id"]]
-            if not item_sales:
-                return 0
-            df = pd.DataFrame(item_sales)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            df = df.sort_values("timestamp")
-            first_day = df["timestamp"].dt.date.min()
-            current_date = pd.to_datetime('2025-07-29').date()
-            date_range = pd.date_range(start=first_day, end=current_date, freq="D")
-            daily_sales = (
-                df.groupby(df["timestamp"].dt.date)
-                .agg({"quantity": "sum", "sale_price": "mean"})
-                .reindex(date_range.date, fill_value=0)
-                .reset_index()
-            )
-            # Robustly ensure first column is always named 'date'
-            first_col = daily_sales.columns[0]
-            if first_col != "date":
-                daily_sales.rename(columns={first_col: "date"}, inplace=True)
-            daily_sales["sale_price"] = daily_sales["sale_price"].replace(0, np.nan)
-            daily_sales["sale_price"] = daily_sales["sale_price"].ffill().fillna(0)
-            days_in_inventory = len(daily_sales)
-            if days_in_inventory < 7:
-                return 0
-            window_size = min(30, max(2, round(days_in_inventory / 5)))
-            if len(daily_sales) < window_size:
-                return 0
-            win = daily_sales.iloc[-window_size:]
-            sales_window = win['quantity'].values
-            padded_sales = np.pad(sales_window, (30 - window_size, 0), 'constant')
-            features = list(padded_sales)
-            features.append(win['sale_price'].mean())
-            tomorrow = current_date + timedelta(days=1)
-            features.append(tomorrow.weekday())
-            features.append(tomorrow.month)
-            features.append(tomorrow.day)
-            features.append(item.get("currentstock", 0))
-            features.append(item.get("minstock", 0))
-            features.append(item.get("unitprice", 0))
-            features.append(window_size)
-            features_scaled = self.scaler.transform([features])
-            predicted_demand = self.demand_model.predict(features_scaled)[0]
-            return max(0, predicted_demand * days_ahead)
+            series = self.daily_series(sales_history, lookback=MAX_WINDOW)
+            cache = self.prediction_cache if version is not None and self.prediction_cache.max_entries > 0 else None
+            items = inventory_data
+            if cache is not None:
+                positions, fingerprints = prediction_fingerprints(series, inventory_data, window_cap)
+                keys = [(version, inventory_data[p]["id"], fp) for p, fp in zip(positions.tolist(), fingerprints)]
+                cached = cache.get_many(keys)
+                missing = [i for i, curve in enumerate(cached) if curve is None]
+                hits = [i for i, curve in enumerate(cached) if curve is not None]
+                if hits:
+                    curves[positions[hits]] = np.stack([cached[i] for i in hits])
+                positions = positions[missing]
+                items = [inventory_data[p] for p in positions.tolist()]
+                if not items:
+                    return curves
+
+            features, rows = build_prediction_rows(series, items, window_cap)
+            if len(features) == 0:
+                return curves
+            features_scaled = scaler.transform(features)
+            with ML_STAGE_SECONDS.time('predict'):
+                predicted_demand = demand_model.predict(features_scaled)
+            predicted = np.maximum(0, predicted_demand.reshape(len(features), horizon))
+            if cache is None:
+                curves[rows] = predicted
+            else:
+                # Every missed item is eligible, so the rows line up with the keys
+                curves[positions] = predicted
+                cache.put_many([keys[i] for i in missing], list(predicted))
+            return curves
         except Exception as e:
             print(f"Error predicting demand: {e}")
-            return 0
+            return np.zeros((len(inventory_data), horizon))
+
+    def predict_demand_batch(self, inventory_data, sales_history, days_ahead=7):
+        """Predict demand for next N days for every item with one scaler and model call.
+
+        Sums the first ``days_ahead`` days of the forecast curve. Past the
+        model's horizon the curve's daily average is used, so a single-day
+        model predicts tomorrow's demand times ``days_ahead``. Returns an
+        array aligned with ``inventory_data``.
+        """
+        curves = self.forecast_batch(inventory_data, sales_history)
+        if days_ahead <= curves.shape[1]:
+            return curves[:, :days_ahead].sum(axis=1)
+        return curves.mean(axis=1) * days_ahead
 
+    @ML_STAGE_SECONDS.time('generate_ml_recommendations')
     def generate_ml_recommendations(self, inventory_data, sales_data):
         """Generate ML-based recommendations using trained model."""
         recommendations = []
+        # Loads the active version if nothing has been loaded yet
+        self.refresh()
         if not self.is_trained:
             print("Model not trained, cannot generate recommendations.")
             return recommendations
-        for item in inventory_data:
-            predicted_weekly_demand = self.predict_demand(item, sales_data, days_ahead=7)
+        weekly_demand = self.predict_demand_batch(inventory_data, sales_data, days_ahead=7)
+        model_label = self.model_label()
+        for item, predicted_weekly_demand in zip(inventory_data, weekly_demand.tolist()):
             current_stock = item.get("currentstock", 0)
             min_stock = item.get("minstock", 0)
             daily_demand = predicted_weekly_demand / 7 if predicted_weekly_demand > 0 else 0
@@ -192,36 +649,107 @@ class InventoryMLModel:
                     "days_remaining": days_remaining_int,
                     "predicted_daily_demand": round(daily_demand, 2),
                     "confidence_score": round(confidence, 2),
-                    "ml_model_used": "RandomForest",
+                    "ml_model_used": model_label,
                     "reason": f"ML predicted {daily_demand:.1f} units/day demand. Stock will last {days_remaining_int} days."
                 })
         return recommendations
 
-    def save_model(self):
+    def save_model(self, metadata=None, buffer=None):
+        """Publish the current model as a new registry version and activate it.
+
+        ``buffer`` is the (features, targets, target days) of recent windows
+        kept with the version for incremental training.
+        """
         try:
-            model_data = {
-                "demand_model": self.demand_model,
-                "scaler": self.scaler,
-                "is_trained": self.is_trained
-            }
-            joblib.dump(model_data, self.model_path)
-            print(f"Model saved to {self.model_path}")
+            with self._swap_lock:
+                demand_model, scaler = self.demand_model, self.scaler
+            extra_arrays = None
+            if buffer is not None:
+                extra_arrays = dict(zip(("buffer_features", "buffer_targets", "buffer_days"), buffer))
+            version = self.registry.publish(demand_model, scaler, metadata, extra_arrays=extra_arrays)
+            self.registry.activate(version)
+            with self._swap_lock:
+                self.version = version
+                self.version_meta = self.registry.load_meta(version)
+                if self.demand_model is demand_model:
+                    self.prediction_version = version
+                self.loaded_at = datetime.now().isoformat()
+                self._active_mtime = self.registry.active_mtime()
+            print(f"Model saved as version {version} in {self.registry.root}")
         except Exception as e:
             print(f"Error saving model: {e}")
 
     def load_model(self):
+        """Swap in the registry's active version if it differs from the one in memory."""
         try:
-            if os.path.exists(self.model_path):
-                model_data = joblib.load(self.model_path)
-                self.demand_model = model_data["demand_model"]
-                self.scaler = model_data["scaler"]
-                self.is_trained = model_data["is_trained"]
-                print("Model loaded successfully")
+            active_mtime = self.registry.active_mtime()
+            version = self.registry.active_version()
+            if version is None:
+                return self._import_legacy_model()
+            if version == self.version:
+                self._active_mtime = active_mtime
                 return True
-            return False
+            demand_model, scaler, meta = self.registry.load(version)
+            with self._swap_lock:
+                self.demand_model = demand_model
+                self.scaler = scaler
+                self.is_trained = True
+                self.model_horizon = meta.get("horizon", 1)
+                self.model_window_cap = meta.get("window_cap", MAX_WINDOW)
+                self.version = version
+                self.version_meta = meta
+                self.prediction_version = version
+                self.loaded_at = datetime.now().isoformat()
+                self._active_mtime = active_mtime
+            print(f"Model version {version} loaded successfully")
+            return True
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
 
+    def _import_legacy_model(self):
+        if not os.path.exists(self.model_path):
+            return False
+        model_data = joblib.load(self.model_path)
+        with self._swap_lock:
+            self.demand_model = model_data["demand_model"]
+            self.scaler = model_data["scaler"]
+            self.is_trained = model_data["is_trained"]
+            self.model_horizon = 1
+            self.model_window_cap = MAX_WINDOW
+            self.prediction_version = None
+        if self.is_trained:
+            self.save_model(metadata={"imported_from": self.model_path})
+        print("Model loaded successfully")
+        return True
+
+    def refresh(self):
+        """Hot-reload when ACTIVE changed on disk; checks at most once per poll interval."""
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < self.registry_poll_interval:
+            return
+        self._checked_at = now
+        if self.version is None or self.registry.active_mtime() != self._active_mtime:
+            self.load_model()
+
+    def model_label(self):
+        """Display name of the backend the active model was trained with."""
+        return backend_label(self.version_meta.get("backend", self.backend))
+
+    def status(self):
+        """In-memory model state; never touches the disk."""
+        return {
+            "is_trained": self.is_trained,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "estimator": self.version_meta.get("estimator", type(self.demand_model).__name__),
+            "backend": self.version_meta.get("backend", self.backend),
+            "label": self.model_label(),
+            "horizon": self.model_horizon,
+            "window_cap": self.model_window_cap,
+            "prediction_cache": self.prediction_cache.stats(),
+            "version_meta": self.version_meta,
+        }
+
 # Global ML model instance
 ml_model = InventoryMLModel()
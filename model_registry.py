@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+FOREST_ARRAYS = ("roots", "left", "right", "feature", "threshold", "value")
+
+
+class MappedForestRegressor:
+    """Predict-only random forest regressor over flat node arrays.
+
+    All trees live in one set of node arrays (children as global node
+    indices, -1 for leaves), so the arrays can be loaded with
+    ``np.load(mmap_mode='r')`` and shared between worker processes through
+    the page cache. Predictions match ``RandomForestRegressor.predict``.
+    """
+
+    def __init__(self, arrays, max_depth):
+        for name in FOREST_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.max_depth = max_depth
+        self.n_estimators = len(self.roots)
+        # ``value`` is 1-D for single-output forests, (nodes, outputs) otherwise
+        self.n_outputs = 1 if self.value.ndim == 1 else self.value.shape[1]
+
+    @staticmethod
+    def flatten(forest):
+        """Node arrays and depth of a fitted forest of regression trees."""
+        trees = []
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            trees.append({
+                "left": tree.children_left.astype(np.int64),
+                "right": tree.children_right.astype(np.int64),
+                "feature": np.where(is_leaf, 0, tree.feature).astype(np.int64),
+                "threshold": tree.threshold.astype(np.float64),
+                "value": (tree.value[:, 0, 0] if tree.n_outputs == 1 else tree.value[:, :, 0]).astype(np.float64),
+            })
+        max_depth = max((estimator.tree_.max_depth for estimator in forest.estimators_), default=0)
+        return _pack_trees(trees), int(max_depth)
+
+    @classmethod
+    def from_forest(cls, forest):
+        arrays, max_depth = cls.flatten(forest)
+        return cls(arrays, max_depth)
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in FOREST_ARRAYS}
+
+    def trees(self):
+        """Per-tree node arrays with tree-local child indices."""
+        bounds = list(self.roots) + [len(self.left)]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            left = np.asarray(self.left[start:stop])
+            right = np.asarray(self.right[start:stop])
+            yield {
+                "left": np.where(left >= 0, left - start, -1),
+                "right": np.where(right >= 0, right - start, -1),
+                "feature": np.asarray(self.feature[start:stop]),
+                "threshold": np.asarray(self.threshold[start:stop]),
+                "value": np.asarray(self.value[start:stop]),
+            }
+
+    @classmethod
+    def combine(cls, forests, max_estimators=None):
+        """One forest averaging the trees of ``forests``, keeping the last ``max_estimators``."""
+        trees = [tree for forest in forests for tree in forest.trees()]
+        if max_estimators is not None:
+            trees = trees[-max_estimators:]
+        # Depth is only reported, so the deepest input forest bounds it
+        return cls(_pack_trees(trees), max(forest.max_depth for forest in forests))
+
+    def predict(self, X):
+        # Trees compare float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_rows = len(X)
+        # One (tree, row) walker per flat slot; walkers that reach a leaf drop out
+        node = np.repeat(np.asarray(self.roots), n_rows)
+        row = np.tile(np.arange(n_rows), self.n_estimators)
+        walking = np.arange(len(node))
+        while walking.size:
+            current = node[walking]
+            left = self.left[current]
+            internal = left >= 0
+            walking, current, left = walking[internal], current[internal], left[internal]
+            go_left = X[row[walking], self.feature[current]] <= self.threshold[current]
+            node[walking] = np.where(go_left, left, self.right[current])
+        values = self.value[node].reshape((self.n_estimators, n_rows) + self.value.shape[1:])
+        # Accumulate tree by tree, as the forest does, for identical results
+        prediction = np.zeros((n_rows,) + self.value.shape[1:])
+        for tree_values in values:
+            prediction += tree_values
+        prediction /= self.n_estimators
+        return prediction
+
+
+def _pack_trees(trees):
+    """Flat node arrays (children as global indices, -1 for leaves) from per-tree arrays."""
+    roots = np.zeros(len(trees), dtype=np.int64)
+    if trees:
+        np.cumsum([len(tree["left"]) for tree in trees[:-1]], out=roots[1:])
+    arrays = {"roots": roots}
+    for name in ("left", "right"):
+        arrays[name] = np.concatenate(
+            [np.where(tree[name] == -1, -1, tree[name] + root) for tree, root in zip(trees, roots)]
+        ) if trees else np.zeros(0, dtype=np.int64)
+    arrays["feature"] = np.concatenate([tree["feature"] for tree in trees]) if trees else np.zeros(0, dtype=np.int64)
+    for name in ("threshold", "value"):
+        arrays[name] = np.concatenate([tree[name] for tree in trees]) if trees else np.zeros(0)
+    return arrays
+
+
+def _is_flattenable_forest(estimator):
+    estimators = getattr(estimator, "estimators_", None)
+    if not estimators or not hasattr(estimator, "n_outputs_"):
+        return False
+    return type(estimator).__name__ in ("RandomForestRegressor", "ExtraTreesRegressor")
+
+
+class ModelRegistry:
+    """Content-hashed model versions on disk with an ACTIVE pointer.
+
+    Each version is a directory named after the hash of its files: the
+    scaler, a ``meta.json`` and either the flattened forest as ``.npy``
+    arrays (loaded memory-mapped) or the pickled estimator. Publishing
+    prunes all but the active version and the ``keep`` newest ones.
+    """
+
+    def __init__(self, root='model_registry', keep=5):
+        self.root = root
+        self.keep = keep
+
+    def _active_path(self):
+        return os.path.join(self.root, 'ACTIVE')
+
+    def version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def publish(self, estimator, scaler, metadata=None, extra_arrays=None):
+        """Write a version and return its id; identical content yields the same id.
+
+        ``extra_arrays`` (name -> array) are stored next to the model and read
+        back with ``load_array``.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=self.root)
+        try:
+            meta = dict(metadata or {})
+            joblib.dump(scaler, os.path.join(staging, 'scaler.joblib'))
+            for name, array in (extra_arrays or {}).items():
+                np.save(os.path.join(staging, f'extra-{name}.npy'), array)
+            meta['extra_arrays'] = sorted(extra_arrays or {})
+            if isinstance(estimator, MappedForestRegressor) or _is_flattenable_forest(estimator):
+                if isinstance(estimator, MappedForestRegressor):
+                    arrays, max_depth = estimator.arrays(), estimator.max_depth
+                else:
+                    arrays, max_depth = MappedForestRegressor.flatten(estimator)
+                for name, array in arrays.items():
+                    np.save(os.path.join(staging, f'{name}.npy'), array)
+                meta.update(kind='forest', max_depth=max_depth, n_estimators=len(arrays['roots']))
+            else:
+                joblib.dump(estimator, os.path.join(staging, 'estimator.joblib'))
+                meta.update(kind='pickle')
+            meta.setdefault('estimator', type(estimator).__name__)
+
+            digest = hashlib.sha256()
+            for name in sorted(os.listdir(staging)):
+                digest.update(name.encode())
+                with open(os.path.join(staging, name), 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+            version = digest.hexdigest()[:16]
+            meta.update(version=version, created_at=datetime.now().isoformat())
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            target = self.version_dir(version)
+            if os.path.exists(target):
+                shutil.rmtree(staging)
+            else:
+                os.replace(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self._prune(version)
+        return version
+
+    def _prune(self, published):
+        # An identical republish keeps its old created_at, so it is kept explicitly
+        versions = self.list_versions()
+        kept = {self.active_version(), published}
+        kept.update(meta['version'] for meta in versions[:self.keep])
+        for meta in versions:
+            if meta['version'] not in kept:
+                shutil.rmtree(self.version_dir(meta['version']), ignore_errors=True)
+
+    def activate(self, version):
+        """Point ACTIVE at ``version`` atomically."""
+        fd, tmp = tempfile.mkstemp(prefix='.active-', dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version)
+        os.replace(tmp, self._active_path())
+
+    def active_version(self):
+        try:
+            with open(self._active_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def active_mtime(self):
+        try:
+            return os.stat(self._active_path()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load_meta(self, version):
+        with open(os.path.join(self.version_dir(version), 'meta.json')) as f:
+            return json.load(f)
+
+    def load(self, version):
+        """Return ``(estimator, scaler, meta)`` for a version, forest arrays memory-mapped."""
+        directory = self.version_dir(version)
+        meta = self.load_meta(version)
+        scaler = joblib.load(os.path.join(directory, 'scaler.joblib'))
+        if meta['kind'] == 'forest':
+            arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in FOREST_ARRAYS}
+            estimator = MappedForestRegressor(arrays, meta['max_depth'])
+        else:
+            estimator = joblib.load(os.path.join(directory, 'estimator.joblib'), mmap_mode='r')
+        return estimator, scaler, meta
+
+    def load_array(self, version, name):
+        """An extra array stored with ``version`` (memory-mapped), or None."""
+        path = os.path.join(self.version_dir(version), f'extra-{name}.npy')
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r')
+
+    def list_versions(self):
+        versions = []
+        if not os.path.isdir(self.root):
+            return versions
+        for name in os.listdir(self.root):
+            meta_path = os.path.join(self.root, name, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    versions.append(json.load(f))
+        versions.sort(key=lambda meta: meta['created_at'], reverse=True)
+        return versions
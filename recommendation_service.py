@@ -1,21 +1,220 @@
-from flask import Flask, request, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, Response, g, request, jsonify
+from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
-from supabase import create_client, Client
-from ml_inventory_model import ml_model
+from storage import create_storage
+from daily_store import sales_store
+from sales_loader import SalesLoader
+from metrics import ML_STAGE_SECONDS, REGISTRY
+import atexit
+import base64
+import hashlib
+import json
+import math
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import numpy as np
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Backend chosen by STORAGE_BACKEND (supabase or sqlite)
+storage = create_storage()
 
+# Independent queries of one pipeline run in parallel on this pool, which
+# also bounds how many requests a process has in flight against the database
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix='storage-query')
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# pandas, scikit-learn and joblib come in with ml_inventory_model, which is
+# imported on first use (or by the warm-up thread) so the service starts
+# answering inventory and sales requests without them
+_ml_model = None
+_ml_model_lock = threading.Lock()
+
+def get_ml_model():
+    """The shared InventoryMLModel, importing the ML stack on the first call"""
+    global _ml_model
+    if _ml_model is None:
+        with _ml_model_lock:
+            if _ml_model is None:
+                from ml_inventory_model import ml_model
+                _ml_model = ml_model
+    return _ml_model
 
 app = Flask(__name__)
-CORS(app, origins=["http://127.0.0.1:5500", "http://localhost:5500"], supports_credentials=True)
+CORS(app, origins=["http://127.0.0.1:5500", "http://localhost:5500"], supports_credentials=True, expose_headers=["X-Next-Cursor"])
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'stocksense_http_request_duration_seconds', 'HTTP request latency by route.', ['method', 'route', 'status']
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule, not the path, so ids and query strings don't multiply the series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+    return response
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+class ResponseCache:
+    """Bounded LRU cache of serialized GET responses.
+
+    Entries are dropped by the write paths that change their data, with a TTL
+    as a fallback for writes made by other processes. A generation counter
+    keeps a response built before an invalidation from being stored after it.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def put(self, key, body, generation):
+        """Store ``body`` unless the cache was invalidated since ``generation``"""
+        entry = {
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest(),
+            # HTTP dates have one-second resolution
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+            'expires': time.monotonic() + self.ttl
+        }
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'not_modified': self.not_modified,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
+
+response_cache = ResponseCache()
+
+def cached_json_response(key, build):
+    """Serve ``build()`` as JSON from the response cache, honoring conditional requests"""
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation()
+        entry = response_cache.put(key, (app.json.dumps(build()) + '\n').encode(), generation)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(entry['etag'])
+    else:
+        not_modified = request.if_modified_since is not None and entry['last_modified'] <= request.if_modified_since
+    response = Response(b'' if not_modified else entry['body'], status=304 if not_modified else 200, mimetype='application/json')
+    if not_modified:
+        response_cache.not_modified += 1
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    return response
+
+sales_loader = SalesLoader(storage)
+
+_sales_store_lock = threading.Lock()
+_sales_store_synced = False
+
+def sync_sales_store(since=None):
+    """Catch the daily sales store up with the sales table.
+
+    The first call loads the persisted store, or without one only the days
+    from ``since`` (an ISO date) on; a later call with an earlier or no
+    ``since`` loads the days still missing. Every call folds in the sales
+    recorded since the last one, including those written by other processes;
+    the endpoints that insert sales rely on this rather than folding them in
+    themselves, so no sale is counted twice.
+    """
+    global _sales_store_synced
+    with _sales_store_lock:
+        # Only a store holding every day is checked against the table's row
+        # count; that count goes out while the store catches up
+        count_future = None
+        if _sales_store_synced and sales_store.history_start is None:
+            count_future = query_pool.submit(storage.count_sales)
+        if not _sales_store_synced and not sales_store.load():
+            sales_loader.load(sales_store, since=since)
+        history_start = sales_store.history_start
+        rebuilt = False
+        sales_loader.catch_up(sales_store)
+        sales_loader.backfill(sales_store, since)
+
+        # The table was rewritten behind our back (e.g. by the demo data
+        # scripts); only a store holding every day can tell
+        if sales_store.history_start is None:
+            sales_count = count_future.result() if count_future is not None else storage.count_sales()
+            if sales_count is not None and sales_count != sales_store.sales_count:
+                print(f"Daily sales store out of sync ({sales_store.sales_count} vs {sales_count} sales), rebuilding")
+                sales_loader.rebuild(sales_store)
+                sales_loader.catch_up(sales_store)
+                rebuilt = True
+        # Caught-up sales are read again from the saved id after a restart, so
+        # only loads, backfills and rebuilds are worth writing out right away
+        if not _sales_store_synced or rebuilt or sales_store.history_start != history_start:
+            sales_store.save()
+        _sales_store_synced = True
+
+def sync_recent_sales():
+    """Sync the daily sales store, reading only the days predictions need on a cold start"""
+    # Once loaded, keep the days the store holds; None (everything) would backfill
+    since = sales_store.history_start if _sales_store_synced else get_ml_model().prediction_history_start()
+    sync_sales_store(since=since)
+
+atexit.register(lambda: _sales_store_synced and sales_store.save())
 
 def parse_naive_datetime(dt_str):
     dt = datetime.fromisoformat(dt_str)
@@ -23,20 +222,63 @@ def parse_naive_datetime(dt_str):
         dt = dt.replace(tzinfo=None)
     return dt
 
+SALE_FIELDS = ['productId', 'quantity', 'salePrice', 'customer']
+
+def _sale_number(value, name):
+    """A JSON number or numeric string as an int if it is whole, else a float"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f'{name} must be a number')
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number') from None
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a number')
+    return int(number) if number.is_integer() else number
+
+def parse_sale(data):
+    """Validated ``(product_id, quantity, sale_price, customer)`` of a POST /sales body
+
+    Numbers may come as strings, as the UI posts them. Raises ValueError with
+    the message for the client, before anything has been written.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Sale must be an object')
+    missing_fields = [field for field in SALE_FIELDS if data.get(field) is None]
+    if missing_fields:
+        raise ValueError(f"Missing required fields: {missing_fields}")
+    product_id = _sale_number(data['productId'], 'productId')
+    if not isinstance(product_id, int):
+        raise ValueError('productId must be an integer')
+    quantity = _sale_number(data['quantity'], 'Quantity')
+    if quantity <= 0:
+        raise ValueError('Quantity must be a positive number')
+    sale_price = _sale_number(data['salePrice'], 'Sale price')
+    if sale_price < 0:
+        raise ValueError('Sale price must not be negative')
+    return product_id, quantity, sale_price, str(data['customer'])
+
+# Running dashboard counters, seeded by update_dashboard_stats and kept
+# current from the delta of each inventory/sales write
+_dashboard_lock = threading.Lock()
+_dashboard_stats = None
+
+DASHBOARD_RECONCILE_INTERVAL = int(os.getenv("DASHBOARD_RECONCILE_INTERVAL", "300"))
+
+@ML_STAGE_SECONDS.time('update_dashboard_stats')
 def update_dashboard_stats():
-    """Update dashboard statistics after any inventory/sales change"""
+    """Recompute dashboard statistics from the full tables and reset the running counters"""
+    global _dashboard_stats
     try:
-        # Get inventory stats
-        inventory_response = supabase.table('inventory').select('*').execute()
-        inventory = inventory_response.data
+        # Get sales count alongside the inventory stats
+        count_future = query_pool.submit(storage.count_sales)
+        inventory = storage.list_inventory(('currentstock', 'minstock', 'unitprice'))
         
         total_items = sum(item.get('currentstock', 0) for item in inventory)
         low_stock_items = len([item for item in inventory if item.get('currentstock', 0) <= item.get('minstock', 0)])
         total_value = sum(item.get('currentstock', 0) * item.get('unitprice', 0) for item in inventory)
         
-        # Get sales count
-        sales_response = supabase.table('sales').select('*').execute()
-        total_sales = len(sales_response.data)
+        total_sales = count_future.result()
         
         # Update dashboard stats
         stats_data = {
@@ -46,97 +288,502 @@ def update_dashboard_stats():
             'total_sales': total_sales,
             'last_updated': datetime.now().isoformat()
         }
+        with _dashboard_lock:
+            _dashboard_stats = dict(stats_data)
+        response_cache.invalidate('dashboard')
         
         # Clear old stats and insert new ones
-        supabase.table('dashboard_stats').delete().neq('id', '00000000-0000-0000-0000-000000000000').execute()
-        supabase.table('dashboard_stats').insert([stats_data]).execute()
+        storage.replace_dashboard_stats(stats_data)
         
         return stats_data
     except Exception as e:
         print(f"Error updating dashboard stats: {e}")
         return None
 
-def generate_ai_recommendations():
-    """Generate ML-based AI recommendations"""
+def apply_dashboard_delta(items=0, low_stock_items=0, value=0, sales=0):
+    """Adjust the running dashboard counters by the effect of one write"""
+    with _dashboard_lock:
+        if _dashboard_stats is None:
+            # Nothing seeded yet; the first read recomputes from the tables
+            return
+        _dashboard_stats['total_items'] += items
+        _dashboard_stats['low_stock_items'] += low_stock_items
+        _dashboard_stats['total_value'] += value
+        _dashboard_stats['total_sales'] += sales
+        _dashboard_stats['last_updated'] = datetime.now().isoformat()
+    response_cache.invalidate('dashboard')
+
+def get_dashboard_stats():
+    """Current dashboard counters, seeding them from the tables on first use"""
+    with _dashboard_lock:
+        if _dashboard_stats is not None:
+            return dict(_dashboard_stats)
+    return update_dashboard_stats()
+
+def start_dashboard_reconciler(interval=DASHBOARD_RECONCILE_INTERVAL):
+    """Periodically recompute the dashboard counters to correct any drift"""
+    def reconcile():
+        update_dashboard_stats()
+        timer = threading.Timer(interval, reconcile)
+        timer.daemon = True
+        timer.start()
+
+    timer = threading.Timer(interval, reconcile)
+    timer.daemon = True
+    timer.start()
+
+# A failed warm-up is started again by the first request this long after it
+MODEL_WARMUP_RETRY_SECONDS = float(os.getenv("MODEL_WARMUP_RETRY_SECONDS", "30"))
+
+class ModelWarmup:
+    """Background startup step that imports the ML stack and loads the active model.
+
+    The server answers requests meanwhile; /ready reports 503 until the
+    warm-up has finished so load balancers can hold traffic back. A failed
+    warm-up is retried once ``MODEL_WARMUP_RETRY_SECONDS`` have passed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._failed_at = None
+        self.status = 'pending'
+        self.stage = None
+        self.started_at = None
+        self.duration = None
+        self.error = None
+
+    def _started(self):
+        return self._thread is not None and not (
+            self.status == 'failed' and time.monotonic() - self._failed_at >= MODEL_WARMUP_RETRY_SECONDS
+        )
+
+    def start(self):
+        if self._started():
+            return
+        with self._lock:
+            if self._started():
+                return
+            self._thread = threading.Thread(target=self._run, name='model-warmup', daemon=True)
+            self.status = 'running'
+            self.error = None
+            self.started_at = datetime.now().isoformat()
+            self._thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.stage = 'importing'
+            ml_model = get_ml_model()
+            self.stage = 'loading_model'
+            ml_model.refresh()
+            self.stage = 'syncing_sales'
+            sync_recent_sales()
+            self.status = 'ready'
+        except Exception as e:
+            print(f"Error warming up the model: {e}")
+            self.error = str(e)
+            self._failed_at = time.monotonic()
+            self.status = 'failed'
+        finally:
+            self.stage = None
+            self.duration = time.perf_counter() - started
+
+    def ready(self):
+        return self.status == 'ready'
+
+    def to_dict(self):
+        return {
+            'ready': self.ready(),
+            'status': self.status,
+            'stage': self.stage,
+            'started_at': self.started_at,
+            'duration_seconds': self.duration,
+            'error': self.error
+        }
+
+model_warmup = ModelWarmup()
+
+def start_model_warmup():
+    """Load the persisted model in the background while the server starts serving"""
+    model_warmup.start()
+
+# WSGI servers (gunicorn...) import the app without running __main__, so the
+# first request starts the warm-up there
+app.before_request(start_model_warmup)
+
+RECOMMENDATION_FIELDS = (
+    'product_id', 'priority', 'recommended_quantity', 'days_remaining', 'sales_velocity',
+    'total_sold', 'reason', 'confidence_score', 'ml_model_used'
+)
+
+# Snapshots kept around after a switch, so readers holding the previous id
+# can still finish their read
+RECOMMENDATION_SNAPSHOTS_KEPT = 2
+
+_recommendations_lock = threading.Lock()
+
+def get_active_snapshot_id():
+    """Id of the recommendation snapshot readers should see"""
+    latest = storage.latest_recommendation_snapshots(1)
+    return latest[0] if latest else None
+
+def write_recommendation_snapshot(recommendations):
+    """Write recommendations as a new snapshot, switch readers to it and drop old ones"""
+    snapshot_id = str(uuid.uuid4())
+    rows = [dict(rec, snapshot_id=snapshot_id) for rec in recommendations]
+    if rows:
+        storage.insert_recommendations(rows)
+
+    # Readers switch to the new snapshot once its marker row exists
+    storage.insert_recommendation_snapshot({
+        'snapshot_id': snapshot_id,
+        'row_count': len(rows),
+        'created_at': datetime.now().isoformat()
+    })
+    response_cache.invalidate('recommendations')
+
+    # Garbage-collect everything but the most recent snapshots
+    kept_ids = storage.latest_recommendation_snapshots(RECOMMENDATION_SNAPSHOTS_KEPT) or [snapshot_id]
+    storage.delete_recommendation_snapshots_except(kept_ids)
+    return snapshot_id
+
+@ML_STAGE_SECONDS.time('generate_ai_recommendations')
+def generate_ai_recommendations(product_ids=None):
+    """Generate ML-based AI recommendations, for all products or only the given ones"""
     try:
-        # Get inventory and sales data
-        inventory_response = supabase.table('inventory').select('*').execute()
-        sales_response = supabase.table('sales').select('*').execute()
-        
-        inventory = inventory_response.data
-        sales = sales_response.data
-        
-        # Clear old recommendations
-        supabase.table('ai_recommendations').delete().neq('id', '00000000-0000-0000-0000-000000000000').execute()
-        
-        # Use ML model for recommendations
-        ml_recommendations = ml_model.generate_ml_recommendations(inventory, sales)
-        
-        # Convert ML recommendations to database format
-        recommendations = []
-        for rec in ml_recommendations:
-            recommendation_data = {
-                'product_id': rec['product_id'],
-                'priority': rec['priority'],
-                'recommended_quantity': rec['recommended_quantity'],
-                'days_remaining': rec['days_remaining'],
-                'sales_velocity': rec['predicted_daily_demand'],
-                'total_sold': 0,  # Will be calculated from sales data
-                'reason': rec['reason'],
-                'confidence_score': rec['confidence_score'],
-                'ml_model_used': rec['ml_model_used']
-            }
+        if product_ids is not None:
+            # Snapshot rows carry the ids as the database types them
+            product_ids = {int(product_id) for product_id in product_ids}
+        with _recommendations_lock:
+            # Get inventory data and the active snapshot while the daily sales
+            # store syncs; the snapshot cannot change while we hold the lock
+            inventory_future = query_pool.submit(storage.list_inventory, ids=product_ids)
+            active_future = query_pool.submit(get_active_snapshot_id)
+            sync_recent_sales()
+            inventory = inventory_future.result()
+            active_snapshot_id = active_future.result()
+            if product_ids is not None and active_snapshot_id is None:
+                # Nothing to carry the other products over from
+                product_ids = None
+                inventory = storage.list_inventory()
+
+            # A partial refresh carries the other products over from the active
+            # snapshot; their rows load while the model runs
+            current_future = None
+            if product_ids is not None:
+                current_future = query_pool.submit(storage.list_recommendations, active_snapshot_id, RECOMMENDATION_FIELDS)
             
-            supabase.table('ai_recommendations').insert([recommendation_data]).execute()
-            recommendations.append(recommendation_data)
-        
-        return recommendations
+            # Use ML model for recommendations
+            ml_recommendations = get_ml_model().generate_ml_recommendations(inventory, sales_store)
+            
+            # Convert ML recommendations to database format
+            recommendations = []
+            for rec in ml_recommendations:
+                recommendations.append({
+                    'product_id': rec['product_id'],
+                    'priority': rec['priority'],
+                    'recommended_quantity': rec['recommended_quantity'],
+                    'days_remaining': rec['days_remaining'],
+                    'sales_velocity': rec['predicted_daily_demand'],
+                    'total_sold': 0,  # Will be calculated from sales data
+                    'reason': rec['reason'],
+                    'confidence_score': rec['confidence_score'],
+                    'ml_model_used': rec['ml_model_used']
+                })
+            
+            snapshot = list(recommendations)
+            if current_future is not None:
+                snapshot.extend(
+                    {field: row.get(field) for field in RECOMMENDATION_FIELDS}
+                    for row in current_future.result() if row['product_id'] not in product_ids
+                )
+            
+            write_recommendation_snapshot(snapshot)
+            return recommendations
     except Exception as e:
         print(f"Error generating AI recommendations: {e}")
         import traceback
         traceback.print_exc()
         return []
 
+RECOMMENDATION_DEBOUNCE_SECONDS = float(os.getenv("RECOMMENDATION_DEBOUNCE_SECONDS", "2"))
+
+class RecommendationWorker:
+    """Background thread that coalesces "recommendations dirty" signals.
+
+    Signals arriving within one debounce interval are merged into a single
+    regeneration covering the union of the affected product ids (or the
+    whole catalog if any signal asked for it).
+    """
+
+    def __init__(self, regenerate, debounce=RECOMMENDATION_DEBOUNCE_SECONDS):
+        self.regenerate = regenerate
+        self.debounce = debounce
+        self._cond = threading.Condition()
+        self._pending_ids = set()
+        self._pending_full = False
+        self._pending_signals = 0
+        self._thread = None
+        self.running = False
+        self.runs = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+    def mark_dirty(self, product_ids=None):
+        """Queue a regeneration for ``product_ids``, or for everything if None"""
+        with self._cond:
+            if product_ids is None:
+                self._pending_full = True
+            else:
+                self._pending_ids.update(product_ids)
+            self._pending_signals += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recommendation-worker', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending_full or self._pending_ids):
+                    self._cond.wait()
+            # Let the rest of the burst arrive before regenerating
+            time.sleep(self.debounce)
+            with self._cond:
+                product_ids = None if self._pending_full else set(self._pending_ids)
+                self._pending_ids.clear()
+                self._pending_full = False
+                self._pending_signals = 0
+                self.running = True
+            started = time.perf_counter()
+            try:
+                self.regenerate(product_ids)
+                self.last_error = None
+            except Exception as e:
+                print(f"Error in recommendation worker: {e}")
+                self.last_error = str(e)
+            finally:
+                self.running = False
+                self.runs += 1
+                self.last_duration = time.perf_counter() - started
+                self.last_run = datetime.now().isoformat()
+
+    def status(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._pending_ids),
+                'full_refresh_pending': self._pending_full,
+                'pending_signals': self._pending_signals,
+                'running': self.running,
+                'runs': self.runs,
+                'last_run': self.last_run,
+                'last_duration_seconds': self.last_duration,
+                'last_error': self.last_error,
+                'debounce_seconds': self.debounce
+            }
+
+recommendation_worker = RecommendationWorker(generate_ai_recommendations)
+
+@app.route('/recommendation-worker', methods=['GET', 'OPTIONS'])
+def get_recommendation_worker_status():
+    """Queue depth and last run of the background recommendation worker"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    return jsonify(recommendation_worker.status())
+
+@app.route('/ready', methods=['GET', 'OPTIONS'])
+def get_readiness():
+    """200 once the model warm-up has finished, 503 while it runs or after it failed"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    return jsonify(model_warmup.to_dict()), 200 if model_warmup.ready() else 503
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, storage query and ML stage histograms in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache-stats', methods=['GET', 'OPTIONS'])
+def get_cache_stats():
+    """Hit/miss counters of the GET response cache"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    return jsonify(response_cache.stats())
+
+TRAINING_JOBS_KEPT = 20
+
+class TrainingJobs:
+    """Runs model training one job at a time on a background thread.
+
+    Each job records its stage (queued, loading_data, preparing_features,
+    fitting, saving, then completed or failed), the number of training rows
+    processed so far and its timings, so clients can poll instead of holding
+    a request open for the whole fit.
+    """
+
+    def __init__(self, train, max_jobs=TRAINING_JOBS_KEPT):
+        self.train = train
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._queue = []
+        self._thread = None
+
+    def submit(self, **options):
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'options': options,
+            'status': 'queued',
+            'stage': 'queued',
+            'rows_processed': 0,
+            'submitted_at': datetime.now().isoformat(),
+            'started': None,
+            'finished': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['status'] in ('queued', 'running'):
+                    break
+                del self._jobs[oldest]
+            self._queue.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='training-jobs', daemon=True)
+                self._thread.start()
+        return job['job_id']
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._thread = None
+                    return
+                job = self._queue.pop(0)
+                job['status'] = 'running'
+                job['started'] = time.perf_counter()
+
+            def progress(stage, rows_processed=None):
+                with self._lock:
+                    job['stage'] = stage
+                    if rows_processed is not None:
+                        job['rows_processed'] = rows_processed
+
+            try:
+                result = self.train(progress, **job['options'])
+                with self._lock:
+                    job['status'] = 'completed' if result.get('success') else 'failed'
+                    job['stage'] = job['status']
+                    job['result'] = result
+            except Exception as e:
+                print(f"Error in training job {job['job_id']}: {e}")
+                import traceback
+                traceback.print_exc()
+                with self._lock:
+                    job['status'] = job['stage'] = 'failed'
+                    job['error'] = str(e)
+            finally:
+                with self._lock:
+                    job['finished'] = time.perf_counter()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            started, finished = job['started'], job['finished']
+            elapsed = None
+            if started is not None:
+                elapsed = (finished if finished is not None else time.perf_counter()) - started
+            status = {key: value for key, value in job.items() if key not in ('started', 'finished')}
+            status['elapsed_seconds'] = elapsed
+            return status
+
+def run_training(progress, mode='full'):
+    """Train the ML model on current data, reporting progress by stage.
+
+    ``mode`` is 'full' (retrain from scratch), 'incremental' (append trees
+    fitted on the days since the active model was trained) or 'streaming'
+    (out-of-core training on chunks of windows).
+    """
+    progress('loading_data')
+    # Get inventory data while the daily sales store syncs; training reads every day
+    inventory_future = query_pool.submit(storage.list_inventory)
+    sync_sales_store()
+    inventory = inventory_future.result()
+    sales_count = sales_store.sales_count
+    print(f"Training model with {sales_count} sales records and {len(inventory)} inventory items")
+    ml_model = get_ml_model()
+    success = ml_model.train_model(
+        sales_store, inventory, progress=progress,
+        incremental=(mode == 'incremental'), streaming=(mode == 'streaming')
+    )
+    sales_store.save()
+    if success:
+        return {
+            'success': True,
+            'message': 'Model trained successfully',
+            'model_info': {
+                'is_trained': ml_model.is_trained,
+                'model_type': ml_model.model_label(),
+                'model_version': ml_model.version,
+                'training_mode': ml_model.version_meta.get('training_mode'),
+                'trained_through': ml_model.version_meta.get('trained_through'),
+                'features_used': 'Historical sales, time features, inventory levels',
+                'training_method': 'Unified'
+            }
+        }
+    return {
+        'success': False,
+        'error': 'Insufficient data for training. Need more sales history.',
+        'details': {
+            'sales_count': sales_count,
+            'inventory_count': len(inventory),
+            'requirements': 'Need at least 3 training samples from sales data spanning multiple days'
+        }
+    }
+
+training_jobs = TrainingJobs(run_training)
+
 @app.route('/train-model', methods=['POST', 'OPTIONS'])
 def train_model():
-    """Train the ML model on current data"""
+    """Start training the ML model on current data; poll /train-jobs/<job_id> for progress.
+
+    Pass ``mode=incremental`` (query string or JSON body) to only learn from
+    the days since the last training run, or ``mode=streaming`` to train out
+    of core in bounded chunks.
+    """
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        # Get inventory and sales data
-        inventory_response = supabase.table('inventory').select('*').execute()
-        sales_response = supabase.table('sales').select('*').execute()
-        inventory = inventory_response.data
-        sales = sales_response.data
-        print(f"Training model with {len(sales)} sales records and {len(inventory)} inventory items")
-        # Only call the revised train_model:
-        success = ml_model.train_model(sales, inventory)
-        if success:
-            return jsonify({
-                'message': 'Model trained successfully',
-                'model_info': {
-                    'is_trained': ml_model.is_trained,
-                    'model_type': 'RandomForest',
-                    'features_used': 'Historical sales, time features, inventory levels',
-                    'training_method': 'Unified'
-                }
-            })
-        else:
-            return jsonify({
-                'error': 'Insufficient data for training. Need more sales history.',
-                'details': {
-                    'sales_count': len(sales),
-                    'inventory_count': len(inventory),
-                    'requirements': 'Need at least 3 training samples from sales data spanning multiple days'
-                }
-            }), 400
-
+        body = request.get_json(silent=True) or {}
+        mode = request.args.get('mode') or body.get('mode') or 'full'
+        if mode not in ('full', 'incremental', 'streaming'):
+            return jsonify({'error': "mode must be 'full', 'incremental' or 'streaming'"}), 400
+        job_id = training_jobs.submit(mode=mode)
+        return jsonify({
+            'message': 'Training started',
+            'job_id': job_id,
+            'status_url': f'/train-jobs/{job_id}'
+        }), 202
     except Exception as e:
         print(f"Error in train_model endpoint: {e}")
-        import traceback
-        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/train-jobs/<job_id>', methods=['GET', 'OPTIONS'])
+def get_training_job(job_id):
+    """Stage, rows processed and elapsed time of a training job"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Training job not found'}), 404
+    return jsonify(job)
+
 
 @app.route('/model-status', methods=['GET', 'OPTIONS'])
 def get_model_status():
@@ -144,13 +791,18 @@ def get_model_status():
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        # Try to load existing model
-        model_loaded = ml_model.load_model()
+        # Cheap poll of the registry's ACTIVE pointer; reloads only on a new version
+        ml_model = get_ml_model()
+        ml_model.refresh()
+        status = ml_model.status()
         
         return jsonify({
-            'is_trained': ml_model.is_trained,
-            'model_loaded': model_loaded,
-            'model_type': 'RandomForest',
+            'is_trained': status['is_trained'],
+            'model_loaded': status['version'] is not None,
+            'model_version': status['version'],
+            'model_loaded_at': status['loaded_at'],
+            'model_type': status['label'],
+            'model_backend': status['backend'],
             'features': [
                 'Last 7 days sales',
                 'Average sale price',
@@ -162,33 +814,75 @@ def get_model_status():
                 'Unit price'
             ],
             'prediction_horizon': '7 days',
-            'model_path': ml_model.model_path
+            'forecast_horizon_days': status['horizon'],
+            'prediction_cache': status['prediction_cache'],
+            'model_registry': ml_model.registry.root
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/forecast', methods=['GET', 'OPTIONS'])
+def get_forecast():
+    """Per-day demand forecast curve for each product (``?product_id=1,2`` to filter)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    try:
+        product_ids = request.args.get('product_id')
+        if product_ids:
+            try:
+                ids = [int(pid) for pid in product_ids.split(',')]
+            except ValueError:
+                return jsonify({'error': 'product_id must be a comma-separated list of ids'}), 400
+            inventory = storage.list_inventory(ids=ids)
+        else:
+            inventory = storage.list_inventory()
+        sync_recent_sales()
+        ml_model = get_ml_model()
+        curves = ml_model.forecast_batch(inventory, sales_store)
+        first_day = datetime.combine(ml_model.current_date(), datetime.min.time()) + timedelta(days=1)
+        dates = [(first_day + timedelta(days=i)).date().isoformat() for i in range(curves.shape[1])]
+        return jsonify({
+            'model_version': ml_model.version,
+            'horizon_days': curves.shape[1],
+            'dates': dates,
+            'forecasts': [
+                {
+                    'product_id': item['id'],
+                    'name': item.get('name'),
+                    'daily_demand': [round(value, 2) for value in curve],
+                    'total_demand': round(sum(curve), 2)
+                }
+                for item, curve in zip(inventory, curves.tolist())
+            ]
+        })
+    except Exception as e:
+        print(f"Error in get_forecast: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/inventory', methods=['GET', 'OPTIONS'])
 def get_inventory():
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        response = supabase.table('inventory').select('*').execute()
-        # Convert lowercase back to camelCase for frontend
-        inventory_data = []
-        for item in response.data:
-            inventory_data.append({
-                'id': item.get('id'),
-                'name': item.get('name'),
-                'sku': item.get('sku'),
-                'category': item.get('category'),
-                'currentStock': item.get('currentstock'),
-                'minStock': item.get('minstock'),
-                'unitPrice': item.get('unitprice'),
-                'supplier': item.get('supplier'),
-                'description': item.get('description'),
-                'lastUpdated': item.get('lastupdated')
-            })
-        return jsonify(inventory_data)
+        def build():
+            # Convert lowercase back to camelCase for frontend
+            inventory_data = []
+            for item in storage.list_inventory():
+                inventory_data.append({
+                    'id': item.get('id'),
+                    'name': item.get('name'),
+                    'sku': item.get('sku'),
+                    'category': item.get('category'),
+                    'currentStock': item.get('currentstock'),
+                    'minStock': item.get('minstock'),
+                    'unitPrice': item.get('unitprice'),
+                    'supplier': item.get('supplier'),
+                    'description': item.get('description'),
+                    'lastUpdated': item.get('lastupdated')
+                })
+            return inventory_data
+
+        return cached_json_response('inventory', build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -208,13 +902,13 @@ def add_inventory():
             print(f"Validation error: {error_msg}")
             return jsonify({'error': error_msg}), 400
         
-        # Remove id if present to let Supabase generate it
+        # Remove id if present to let the database generate it
         if 'id' in data:
             del data['id']
             print("Removed id field")
         
-        # Convert camelCase to lowercase for Supabase
-        supabase_data = {
+        # Convert camelCase to lowercase column names
+        item_data = {
             'name': data['name'],
             'sku': data['sku'],
             'category': data['category'],
@@ -226,27 +920,95 @@ def add_inventory():
             'lastupdated': data['lastUpdated']
         }
         
-        print(f"Data to insert: {supabase_data}")
-        response = supabase.table('inventory').insert([supabase_data]).execute()
-        print(f"Supabase response: {response.data}")
+        print(f"Data to insert: {item_data}")
+        inserted = storage.insert_inventory([item_data])
+        response_cache.invalidate('inventory')
+        print(f"Storage response: {inserted}")
         
-        # Update dashboard stats after inventory change
-        update_dashboard_stats()
+        # Update dashboard counters after inventory change
+        stock = item_data['currentstock']
+        apply_dashboard_delta(
+            items=stock,
+            low_stock_items=int(stock <= item_data['minstock']),
+            value=stock * item_data['unitprice']
+        )
         
-        return jsonify(response.data)
+        return jsonify(inserted)
     except Exception as e:
         print(f"Error in add_inventory: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+SALES_PAGE_SIZE = 100
+SALES_MAX_PAGE_SIZE = 1000
+
+def encode_sales_cursor(row):
+    """Opaque keyset cursor pointing just past ``row``"""
+    raw = json.dumps([row['timestamp'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sales_cursor(cursor):
+    """``(timestamp, id)`` from a cursor; ValueError unless it is one we issued"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    value = json.loads(raw)
+    if not (
+        isinstance(value, list) and len(value) == 2
+        and isinstance(value[0], str) and isinstance(value[1], int) and not isinstance(value[1], bool)
+    ):
+        raise ValueError('Invalid cursor')
+    timestamp, sale_id = value
+    return timestamp, sale_id
+
+def stream_sales(filters, before, limit):
+    """Yield sales as NDJSON lines, fetching one keyset page at a time"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = SALES_MAX_PAGE_SIZE if remaining is None else min(remaining, SALES_MAX_PAGE_SIZE)
+        rows = storage.list_sales_page(page_size, before=before, **filters)
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        if len(rows) < page_size:
+            return
+        before = (rows[-1]['timestamp'], rows[-1]['id'])
+        if remaining is not None:
+            remaining -= len(rows)
+
 @app.route('/sales', methods=['GET', 'OPTIONS'])
 def get_sales():
+    """Sales newest first, one keyset page at a time.
+
+    Query parameters: ``limit``, ``cursor`` (from the ``X-Next-Cursor``
+    header of the previous page), ``product_id``, ``start`` and ``end``
+    (ISO timestamps). ``format=ndjson`` streams every matching row (up to
+    ``limit`` if given) as newline-delimited JSON instead.
+    """
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        response = supabase.table('sales').select('*, inventory(name, sku)').execute()
-        return jsonify(response.data)
+        filters = {
+            'product_id': request.args.get('product_id'),
+            'start': request.args.get('start'),
+            'end': request.args.get('end')
+        }
+        cursor = request.args.get('cursor')
+        try:
+            before = decode_sales_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit <= 0:
+            return jsonify({'error': 'limit must be positive'}), 400
+
+        if request.args.get('format') == 'ndjson':
+            return Response(stream_sales(filters, before, limit), mimetype='application/x-ndjson')
+
+        limit = min(limit or SALES_PAGE_SIZE, SALES_MAX_PAGE_SIZE)
+        rows = storage.list_sales_page(limit, before=before, **filters)
+        response = jsonify(rows)
+        if len(rows) == limit:
+            response.headers['X-Next-Cursor'] = encode_sales_cursor(rows[-1])
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -258,74 +1020,192 @@ def add_sale():
         data = request.get_json()
         print(f"Received sale data: {data}")
         
-        # Validate required fields
-        required_fields = ['productId', 'quantity', 'salePrice', 'customer']
-        missing_fields = [field for field in required_fields if field not in data or data[field] is None]
-        if missing_fields:
-            error_msg = f"Missing required fields: {missing_fields}"
-            return jsonify({'error': error_msg}), 400
+        # Validate and coerce every field before writing anything
+        try:
+            product_id, quantity, sale_price, customer = parse_sale(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Get product details
-        product_response = supabase.table('inventory').select('*').eq('id', data['productId']).execute()
-        if not product_response.data:
+        product = storage.get_inventory_item(product_id)
+        if product is None:
             return jsonify({'error': 'Product not found'}), 404
         
-        product = product_response.data[0]
-        
         # Check stock availability
-        if product.get('currentstock', 0) < data['quantity']:
+        if product.get('currentstock', 0) < quantity:
             return jsonify({'error': 'Insufficient stock'}), 400
         
-        # Calculate total amount
-        total_amount = data['quantity'] * data['salePrice']
-        
-        # Create sale record
+        # Create sale record; the store and the model key products by the
+        # inventory row's id
+        product_id = product['id']
         sale_data = {
-            'product_id': data['productId'],
-            'quantity': data['quantity'],
-            'sale_price': data['salePrice'],
-            'total_amount': total_amount,
-            'customer': data['customer'],
+            'product_id': product_id,
+            'quantity': quantity,
+            'sale_price': sale_price,
+            'total_amount': quantity * sale_price,
+            'customer': customer,
             'timestamp': datetime.now().isoformat()
         }
         
-        # Insert sale
-        sale_response = supabase.table('sales').insert([sale_data]).execute()
-        
-        # Update inventory stock
-        new_stock = product.get('currentstock', 0) - data['quantity']
-        supabase.table('inventory').update({
+        # Insert the sale together with the stock update, so nothing below
+        # can leave them out of step
+        old_stock = product.get('currentstock', 0)
+        new_stock = old_stock - quantity
+        inserted_sales = storage.record_sales([sale_data], {product_id: {
             'currentstock': new_stock,
             'lastupdated': datetime.now().date().isoformat()
-        }).eq('id', data['productId']).execute()
+        }})
+        response_cache.invalidate('inventory')
         
-        # Update dashboard stats
-        update_dashboard_stats()
+        # Catching up folds it into the daily sales store
+        sync_recent_sales()
+        
+        # Update dashboard counters
+        min_stock = product.get('minstock', 0)
+        apply_dashboard_delta(
+            items=-quantity,
+            low_stock_items=int(new_stock <= min_stock) - int(old_stock <= min_stock),
+            value=-quantity * product.get('unitprice', 0),
+            sales=1
+        )
         
-        # Generate new AI recommendations
-        generate_ai_recommendations()
+        # Regenerate AI recommendations for this product in the background
+        recommendation_worker.mark_dirty([product_id])
         
-        return jsonify(sale_response.data)
+        return jsonify(inserted_sales)
     except Exception as e:
         print(f"Error in add_sale: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+SALES_BATCH_MAX_LINES = int(os.getenv("SALES_BATCH_MAX_LINES", "5000"))
+
+@app.route('/sales/batch', methods=['POST', 'OPTIONS'])
+def add_sales_batch():
+    """Record many sales at once, e.g. a POS batch or a backfill.
+
+    Takes ``{"sales": [...]}`` (or a bare list) of lines shaped like the
+    POST /sales body, each optionally with an ISO ``timestamp`` no later
+    than now. Stock is checked with one inventory query, all valid lines
+    are inserted in one call together with one stock update per product
+    and the dashboard and recommendations are refreshed once. Lines that
+    fail validation or would oversell are reported in ``failed`` by index
+    and skipped.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    try:
+        data = request.get_json(silent=True)
+        lines = data.get('sales') if isinstance(data, dict) else data
+        if not isinstance(lines, list):
+            return jsonify({'error': 'Expected a list of sales'}), 400
+        if len(lines) > SALES_BATCH_MAX_LINES:
+            return jsonify({'error': f'At most {SALES_BATCH_MAX_LINES} sales per batch'}), 400
+
+        # Every field is checked and coerced per line before anything is written
+        now = datetime.now()
+        failed = []
+        valid = []
+        for index, line in enumerate(lines):
+            try:
+                product_id, quantity, sale_price, customer = parse_sale(line)
+            except ValueError as e:
+                failed.append({'index': index, 'error': str(e)})
+                continue
+            timestamp = now
+            if line.get('timestamp') is not None:
+                try:
+                    timestamp = parse_naive_datetime(line['timestamp'])
+                except (TypeError, ValueError):
+                    failed.append({'index': index, 'error': 'Invalid timestamp'})
+                    continue
+                if timestamp > now:
+                    failed.append({'index': index, 'error': 'Timestamp is in the future'})
+                    continue
+            valid.append((index, product_id, quantity, sale_price, customer, timestamp))
+
+        # One query for every referenced product, then check stock line by line
+        # against what the earlier lines of the batch left
+        products = {
+            item['id']: item
+            for item in storage.list_inventory(
+                ('id', 'currentstock', 'minstock', 'unitprice'), ids={line[1] for line in valid}
+            )
+        } if valid else {}
+        remaining = {product_id: item.get('currentstock', 0) for product_id, item in products.items()}
+        sold = {}
+        sale_rows = []
+        for index, product_id, quantity, sale_price, customer, timestamp in valid:
+            if product_id not in products:
+                failed.append({'index': index, 'error': 'Product not found'})
+                continue
+            if remaining[product_id] < quantity:
+                failed.append({'index': index, 'error': 'Insufficient stock'})
+                continue
+            remaining[product_id] -= quantity
+            sold[product_id] = sold.get(product_id, 0) + quantity
+            sale_rows.append({
+                'product_id': product_id,
+                'quantity': quantity,
+                'sale_price': sale_price,
+                'total_amount': quantity * sale_price,
+                'customer': customer,
+                'timestamp': timestamp.isoformat()
+            })
+        failed.sort(key=lambda failure: failure['index'])
+
+        if not sale_rows:
+            return jsonify({'inserted': [], 'failed': failed})
+
+        # Insert the sales together with one stock update per product, then
+        # catch the daily sales store up with them
+        today = now.date().isoformat()
+        inserted_sales = storage.record_sales(sale_rows, {
+            product_id: {'currentstock': remaining[product_id], 'lastupdated': today} for product_id in sold
+        })
+        response_cache.invalidate('inventory')
+        sync_recent_sales()
+
+        # Update dashboard counters
+        low_stock_change = 0
+        value_change = 0
+        for product_id, quantity in sold.items():
+            product = products[product_id]
+            old_stock = product.get('currentstock', 0)
+            min_stock = product.get('minstock', 0)
+            low_stock_change += int(remaining[product_id] <= min_stock) - int(old_stock <= min_stock)
+            value_change -= quantity * product.get('unitprice', 0)
+        apply_dashboard_delta(
+            items=-sum(sold.values()),
+            low_stock_items=low_stock_change,
+            value=value_change,
+            sales=len(sale_rows)
+        )
+
+        # Regenerate AI recommendations for the sold products in the background
+        recommendation_worker.mark_dirty(list(sold))
+
+        return jsonify({'inserted': inserted_sales, 'failed': failed})
+    except Exception as e:
+        print(f"Error in add_sales_batch: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/dashboard', methods=['GET', 'OPTIONS'])
 def get_dashboard():
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        # Get latest dashboard stats
-        response = supabase.table('dashboard_stats').select('*').order('created_at', desc=True).limit(1).execute()
-        
-        if response.data:
-            return jsonify(response.data[0])
-        else:
-            # Generate initial stats if none exist
-            stats = update_dashboard_stats()
-            return jsonify(stats)
+        def build():
+            # Serve the running counters; only the first call hits the tables
+            stats = get_dashboard_stats()
+            if stats is None:
+                raise RuntimeError('Dashboard statistics unavailable')
+            return stats
+
+        return cached_json_response('dashboard', build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -334,8 +1214,13 @@ def get_recommendations():
     if request.method == 'OPTIONS':
         return '', 200
     try:
-        response = supabase.table('ai_recommendations').select('*, inventory(name, sku, supplier)').execute()
-        return jsonify(response.data)
+        def build():
+            snapshot_id = get_active_snapshot_id()
+            if snapshot_id is None:
+                return []
+            return storage.list_recommendations(snapshot_id, with_products=True)
+
+        return cached_json_response('recommendations', build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -352,52 +1237,97 @@ def generate_recommendations():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/recommendations', methods=['POST'])
-def recommendations():
-    data = request.get_json()
-    inventory = data.get('inventory', [])
-    sales = data.get('sales', [])
-    now = datetime.now()
-    thirty_days_ago = now - timedelta(days=30)
+RULE_BASED_WINDOW_DAYS = 30
+RULE_BASED_PRIORITY_ORDER = {'high': 3, 'medium': 2, 'low': 1}
+
+@ML_STAGE_SECONDS.time('rule_based_recommendations')
+def rule_based_recommendations(inventory, sales, now=None):
+    """30-day sales velocity reorder heuristic over the whole catalog at once.
+
+    Sales are matched to items by ``productId`` through one id index and
+    their timestamps are parsed once, so the cost is O(items + sales)
+    rather than O(items x sales). Velocity, days remaining, reorder
+    quantity and priority are array operations; rows come out sorted by
+    priority (high first), then days remaining, then inventory order.
+    """
+    now = now or datetime.now()
+    window_start = np.datetime64(now - timedelta(days=RULE_BASED_WINDOW_DAYS), 'us')
+    id_codes = {}
+    item_codes = np.array([id_codes.setdefault(item['id'], len(id_codes)) for item in inventory], dtype=np.int64)
+
+    # Only sales of listed products are looked at (and parsed), as before
+    sale_codes, quantities, timestamps = [], [], []
+    for sale in sales:
+        code = id_codes.get(sale['productId'])
+        if code is not None:
+            sale_codes.append(code)
+            quantities.append(sale['quantity'])
+            timestamps.append(parse_naive_datetime(sale['timestamp']))
+    sale_codes = np.array(sale_codes, dtype=np.int64)
+    recent = np.array(timestamps, dtype='datetime64[us]') >= window_start
+    recent_quantities = np.array(quantities, dtype=np.float64)[recent]
+    # bincount adds in input order, so sums equal the per-item sum()
+    totals = np.bincount(sale_codes[recent], weights=recent_quantities, minlength=len(id_codes))[item_codes]
+    # Totals stay ints unless the item had a fractional-typed quantity
+    float_totals = np.bincount(
+        sale_codes[recent],
+        weights=np.array([isinstance(q, float) for q in quantities], dtype=np.float64)[recent],
+        minlength=len(id_codes)
+    )[item_codes] > 0
+
+    current_stock = np.array([item['currentStock'] for item in inventory], dtype=np.float64)
+    min_stock = np.array([item['minStock'] for item in inventory], dtype=np.float64)
+    velocity = np.where(totals > 0, totals / RULE_BASED_WINDOW_DAYS, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_remaining = np.where(velocity > 0, current_stock / velocity, np.inf)
+    needs_reorder = (current_stock <= min_stock) | (days_remaining <= 7)
+
+    lead_time_days = 7
+    demand_during_lead_time = velocity * lead_time_days
+    recommended_quantity = np.maximum(
+        np.round(demand_during_lead_time + min_stock - current_stock), min_stock * 2
+    )
+    priority_rank = np.select(
+        [current_stock == 0, (current_stock <= min_stock) | (days_remaining <= 3), days_remaining <= 7],
+        [RULE_BASED_PRIORITY_ORDER['high'], RULE_BASED_PRIORITY_ORDER['high'], RULE_BASED_PRIORITY_ORDER['medium']],
+        RULE_BASED_PRIORITY_ORDER['low']
+    )
+    priority_names = {rank: name for name, rank in RULE_BASED_PRIORITY_ORDER.items()}
+    # Stock that never runs out (no recent sales) reports 999 days, as the ML path does
+    days_remaining_int = np.where(
+        np.isinf(days_remaining), 999, np.maximum(0, np.trunc(np.nan_to_num(days_remaining, posinf=0)))
+    ).astype(np.int64)
+
+    rows = np.flatnonzero(needs_reorder)
+    # lexsort is stable, so ties keep inventory order
+    order = np.lexsort((days_remaining_int[rows], -priority_rank[rows]))
     recommendations = []
+    for position in rows[order].tolist():
+        total_sold = totals[position]
+        velocity_value = float(velocity[position])
+        recommendations.append({
+            'item': inventory[position],
+            'priority': priority_names[int(priority_rank[position])],
+            'recommendedQuantity': int(recommended_quantity[position]),
+            'daysRemaining': int(days_remaining_int[position]),
+            'salesVelocity': round(velocity_value, 2) if total_sold > 0 else 0,
+            'totalSold': float(total_sold) if float_totals[position] else int(total_sold)
+        })
+    return recommendations
 
-    for item in inventory:
-        # Calculate sales velocity (items sold per day over last 30 days)
-        item_sales = [
-            sale for sale in sales
-            if sale['productId'] == item['id'] and parse_naive_datetime(sale['timestamp']) >= thirty_days_ago
-        ]
-        total_sold = sum(sale['quantity'] for sale in item_sales)
-        sales_velocity = total_sold / 30 if total_sold > 0 else 0
-        days_remaining = item['currentStock'] / sales_velocity if sales_velocity > 0 else float('inf')
-        needs_reorder = item['currentStock'] <= item['minStock'] or days_remaining <= 7
-        if needs_reorder:
-            lead_time_days = 7
-            safety_stock = item['minStock']
-            demand_during_lead_time = sales_velocity * lead_time_days
-            recommended_quantity = max(
-                int(round(demand_during_lead_time + safety_stock - item['currentStock'])),
-                item['minStock'] * 2
-            )
-            priority = 'low'
-            if item['currentStock'] == 0:
-                priority = 'high'
-            elif item['currentStock'] <= item['minStock'] or days_remaining <= 3:
-                priority = 'high'
-            elif days_remaining <= 7:
-                priority = 'medium'
-            recommendations.append({
-                'item': item,
-                'priority': priority,
-                'recommendedQuantity': recommended_quantity,
-                'daysRemaining': max(0, int(days_remaining)),
-                'salesVelocity': round(sales_velocity, 2),
-                'totalSold': total_sold
-            })
-    # Sort by priority (high first) and then by days remaining
-    priority_order = {'high': 3, 'medium': 2, 'low': 1}
-    recommendations.sort(key=lambda x: (-priority_order[x['priority']], x['daysRemaining']))
-    return jsonify(recommendations)
+@app.route('/recommendations/rule-based', methods=['POST', 'OPTIONS'])
+def recommendations():
+    """Rule-based reorder suggestions for the posted ``inventory`` and ``sales``.
+
+    This used to share POST /recommendations with generate_recommendations,
+    which Flask always dispatched to first, so it now has its own URL.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    data = request.get_json()
+    return jsonify(rule_based_recommendations(data.get('inventory', []), data.get('sales', [])))
 
 if __name__ == '__main__':
+    start_model_warmup()
+    start_dashboard_reconciler()
     app.run(debug=True) 
\ No newline at end of file
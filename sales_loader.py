@@ -0,0 +1,55 @@
+# Columns the model reads from the sales table, and the id catching up resumes from
+SALES_COLUMNS = ('id', 'product_id', 'quantity', 'sale_price', 'timestamp')
+
+
+class SalesLoader:
+    """Fills a DailySalesStore with the sales history InventoryMLModel reads.
+
+    Whole days come pre-aggregated per product from the database, so a load
+    transfers one row per product and day instead of one per sale, and new
+    sales are caught up selecting only SALES_COLUMNS. Loads for prediction
+    push the window into the query: only the days from ``since`` on are
+    read, plus each product's first sale day, which the adaptive window
+    size depends on, and the last price before the window, which seeds it.
+
+    Catching up goes by sale id, not timestamp, so backdated sales and
+    sales written by other processes are picked up once each.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def load(self, store, since=None):
+        """Fill an empty ``store`` with the days from ``since`` on (every day if None)."""
+        # Read first: sales added meanwhile are either in the totals (and
+        # below their highest id) or caught up afterwards
+        last_sale_id = self.storage.last_sale_id()
+        rows = self.storage.list_daily_sales(since=since)
+        store.add_daily_totals(rows)
+        if since is not None:
+            store.add_history(self.storage.list_sales_history(since), since)
+        ids = [row["last_id"] for row in rows] + [last_sale_id]
+        store.last_sale_id = max((i for i in ids if i is not None), default=None)
+
+    def backfill(self, store, since=None):
+        """Load the days between ``since`` (or the first sale) and the start of a partial store."""
+        if store.history_start is None or (since is not None and since >= store.history_start):
+            return
+        history = self.storage.list_sales_history(since) if since is not None else None
+        rows = self.storage.list_daily_sales(since=since, until=store.history_start)
+        # The seed prices kept before the old start are part of these days
+        store.clear_before(store.history_start)
+        store.add_daily_totals(rows)
+        if history is None:
+            store.history_start = None
+        else:
+            store.add_history(history, since)
+
+    def catch_up(self, store):
+        """Fold the sales with an id above the store's last one into it."""
+        store.add_sales(self.storage.list_sales(SALES_COLUMNS, after_id=store.last_sale_id))
+
+    def rebuild(self, store):
+        """Discard the store and load the full history again."""
+        store.clear()
+        self.load(store)
@@ -0,0 +1,605 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from metrics import REGISTRY, ROW_BUCKETS
+
+
+class Storage(ABC):
+    """Data access used by the service and the utility scripts.
+
+    Rows are plain dicts with the lowercase column names of the Supabase
+    tables (``currentstock``, ``sale_price``...). ``columns`` arguments take a
+    sequence of column names; None means every column. Backends implement
+    every abstract method; the others have generic defaults to override.
+    """
+
+    # inventory
+    @abstractmethod
+    def list_inventory(self, columns=None, ids=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_inventory_item(self, product_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_inventory(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_inventory(self, product_id, values):
+        raise NotImplementedError
+
+    def update_inventory_many(self, updates):
+        """Apply ``{product_id: values}`` updates; backends may batch them in one round trip."""
+        for product_id, values in updates.items():
+            self.update_inventory(product_id, values)
+
+    # sales
+    @abstractmethod
+    def list_sales(self, columns=None, after_id=None):
+        """Sales rows in id order, optionally only those with an id above ``after_id``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def last_sale_id(self):
+        """Highest id in the sales table, or None if it is empty."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_sales_page(self, limit, before=None, product_id=None, start=None, end=None):
+        """One page of sales, newest first, with ``name`` and ``sku`` nested under ``inventory``.
+
+        ``before`` is a ``(timestamp, id)`` keyset cursor: only rows strictly
+        older in (timestamp, id) order are returned. ``start``/``end`` bound
+        the timestamp as ``start <= timestamp < end``.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_daily_sales(self, since=None, until=None):
+        """Sales pre-aggregated per product and day, for days ``since <= day < until``.
+
+        Rows hold ``product_id``, ``day`` (ISO date), ``quantity``,
+        ``price_sum`` and ``price_count`` (over non-null sale prices),
+        ``sales`` (row count) and ``last_id`` (highest sale id).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_sales_history(self, before):
+        """What a load of the days from ``before`` on misses, per product.
+
+        Rows hold ``product_id``, ``first_day`` (ISO date of the earliest
+        sale) and ``day``, ``price_sum`` and ``price_count`` of the last day
+        before ``before`` with a nonzero price (None if there is none).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_sales(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_sales(self, rows):
+        raise NotImplementedError
+
+    def record_sales(self, rows, stock_updates):
+        """Insert sale ``rows`` and apply the ``{product_id: values}`` inventory updates they cause.
+
+        Backends with transactions do both in one; returns the inserted rows.
+        """
+        inserted = self.insert_sales(rows)
+        self.update_inventory_many(stock_updates)
+        return inserted
+
+    @abstractmethod
+    def delete_all_sales(self):
+        raise NotImplementedError
+
+    # dashboard_stats
+    @abstractmethod
+    def replace_dashboard_stats(self, stats):
+        raise NotImplementedError
+
+    # ai_recommendations
+    @abstractmethod
+    def insert_recommendations(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_recommendations(self, snapshot_id, columns=None, with_products=False):
+        """Rows of one snapshot; ``with_products`` nests name, sku and supplier under ``inventory``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_recommendation_snapshot(self, snapshot):
+        raise NotImplementedError
+
+    @abstractmethod
+    def latest_recommendation_snapshots(self, limit):
+        """Ids of the most recent snapshots, newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_recommendation_snapshots_except(self, keep_ids):
+        """Drop every snapshot (marker and rows) not listed in ``keep_ids``."""
+        raise NotImplementedError
+
+
+def _select(columns):
+    return '*' if columns is None else ', '.join(columns)
+
+
+class SupabaseStorage(Storage):
+    """Storage backed by the hosted Supabase tables."""
+
+    def __init__(self, url, key):
+        self.url = url
+        self.key = key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on the first query, so importing the service stays cheap
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self.url, self.key)
+        return self._client
+
+    def list_inventory(self, columns=None, ids=None):
+        query = self.client.table('inventory').select(_select(columns))
+        if ids is not None:
+            query = query.in_('id', list(ids))
+        return query.execute().data
+
+    def get_inventory_item(self, product_id):
+        response = self.client.table('inventory').select('*').eq('id', product_id).execute()
+        return response.data[0] if response.data else None
+
+    def insert_inventory(self, rows):
+        return self.client.table('inventory').insert(rows).execute().data
+
+    def update_inventory(self, product_id, values):
+        self.client.table('inventory').update(values).eq('id', product_id).execute()
+
+    def list_sales(self, columns=None, after_id=None):
+        query = self.client.table('sales').select(_select(columns))
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.order('id').execute().data
+
+    def last_sale_id(self):
+        rows = self.client.table('sales').select('id').order('id', desc=True).limit(1).execute().data
+        return rows[0]['id'] if rows else None
+
+    def list_daily_sales(self, since=None, until=None):
+        # sales_daily is a view, see the README
+        query = self.client.table('sales_daily').select('*')
+        if since is not None:
+            query = query.gte('day', since)
+        if until is not None:
+            query = query.lt('day', until)
+        return query.execute().data
+
+    def list_sales_history(self, before):
+        # Postgres function, see the README
+        return self.client.rpc('sales_history', {'before': before}).execute().data
+
+    def list_sales_page(self, limit, before=None, product_id=None, start=None, end=None):
+        query = self.client.table('sales').select('*, inventory(name, sku)')
+        if product_id is not None:
+            query = query.eq('product_id', product_id)
+        if start is not None:
+            query = query.gte('timestamp', start)
+        if end is not None:
+            query = query.lt('timestamp', end)
+        if before is not None:
+            timestamp, sale_id = before
+            query = query.or_(
+                f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt."{sale_id}")'
+            )
+        return query.order('timestamp', desc=True).order('id', desc=True).limit(limit).execute().data
+
+    def count_sales(self):
+        return self.client.table('sales').select('id', count='exact').limit(1).execute().count
+
+    def insert_sales(self, rows):
+        return self.client.table('sales').insert(rows).execute().data
+
+    def delete_all_sales(self):
+        self.client.table('sales').delete().neq('id', '00000000-0000-0000-0000-000000000000').execute()
+
+    def replace_dashboard_stats(self, stats):
+        self.client.table('dashboard_stats').delete().neq('id', '00000000-0000-0000-0000-000000000000').execute()
+        self.client.table('dashboard_stats').insert([stats]).execute()
+
+    def insert_recommendations(self, rows):
+        self.client.table('ai_recommendations').insert(rows).execute()
+
+    def list_recommendations(self, snapshot_id, columns=None, with_products=False):
+        select = _select(columns)
+        if with_products:
+            select += ', inventory(name, sku, supplier)'
+        return self.client.table('ai_recommendations').select(select).eq('snapshot_id', snapshot_id).execute().data
+
+    def insert_recommendation_snapshot(self, snapshot):
+        self.client.table('ai_recommendation_snapshots').insert([snapshot]).execute()
+
+    def latest_recommendation_snapshots(self, limit):
+        response = (
+            self.client.table('ai_recommendation_snapshots')
+            .select('snapshot_id')
+            .order('created_at', desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return [row['snapshot_id'] for row in response.data]
+
+    def delete_recommendation_snapshots_except(self, keep_ids):
+        self.client.table('ai_recommendations').delete().not_.in_('snapshot_id', list(keep_ids)).execute()
+        self.client.table('ai_recommendation_snapshots').delete().not_.in_('snapshot_id', list(keep_ids)).execute()
+
+
+SQLITE_SCHEMA = """
+create table if not exists inventory (
+    id integer primary key autoincrement,
+    name text,
+    sku text,
+    category text,
+    currentstock integer default 0,
+    minstock integer default 0,
+    unitprice real default 0,
+    supplier text,
+    description text,
+    lastupdated text,
+    created_at text default current_timestamp
+);
+create table if not exists sales (
+    id integer primary key autoincrement,
+    product_id integer references inventory(id),
+    quantity integer,
+    sale_price real,
+    total_amount real,
+    customer text,
+    timestamp text,
+    created_at text default current_timestamp
+);
+create index if not exists sales_product_id_timestamp on sales (product_id, timestamp);
+create index if not exists sales_timestamp on sales (timestamp);
+create table if not exists dashboard_stats (
+    id integer primary key autoincrement,
+    total_items integer,
+    low_stock_items integer,
+    total_value real,
+    total_sales integer,
+    last_updated text,
+    created_at text default current_timestamp
+);
+create table if not exists ai_recommendations (
+    id integer primary key autoincrement,
+    snapshot_id text,
+    product_id integer references inventory(id),
+    priority text,
+    recommended_quantity integer,
+    days_remaining integer,
+    sales_velocity real,
+    total_sold integer,
+    reason text,
+    confidence_score real,
+    ml_model_used text,
+    created_at text default current_timestamp
+);
+create index if not exists ai_recommendations_snapshot_id on ai_recommendations (snapshot_id);
+create table if not exists ai_recommendation_snapshots (
+    snapshot_id text primary key,
+    row_count integer not null,
+    created_at text not null
+);
+create index if not exists ai_recommendation_snapshots_created_at on ai_recommendation_snapshots (created_at);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Embedded storage in a local SQLite file, or in memory with ``:memory:``.
+
+    One connection is shared by all threads and serialized with a lock.
+    """
+
+    def __init__(self, path='stock_sense.db'):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self.conn.execute('pragma journal_mode=wal')
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def _insert_rows(self, table, rows):
+        # Runs inside the caller's transaction; returns the new rowids
+        inserted = []
+        for row in rows:
+            columns = list(row)
+            cursor = self.conn.execute(
+                f"insert into {table} ({', '.join(columns)}) values ({', '.join('?' * len(columns))})",
+                [row[c] for c in columns],
+            )
+            inserted.append(cursor.lastrowid)
+        return inserted
+
+    def _update_inventory_rows(self, updates):
+        for product_id, values in updates.items():
+            columns = list(values)
+            self.conn.execute(
+                f"update inventory set {', '.join(f'{c} = ?' for c in columns)} where id = ?",
+                [values[c] for c in columns] + [product_id],
+            )
+
+    def _insert(self, table, rows):
+        with self._lock, self.conn:
+            inserted = self._insert_rows(table, rows)
+        return self._select_inserted(table, inserted)
+
+    def _select_inserted(self, table, inserted):
+        result = []
+        for start in range(0, len(inserted), 500):
+            chunk = inserted[start:start + 500]
+            marks = ', '.join('?' * len(chunk))
+            result.extend(self._query(f"select * from {table} where rowid in ({marks}) order by rowid", chunk))
+        return result
+
+    def _execute(self, sql, params=()):
+        with self._lock, self.conn:
+            self.conn.execute(sql, params)
+
+    def list_inventory(self, columns=None, ids=None):
+        if ids is None:
+            return self._query(f"select {_select(columns)} from inventory order by id")
+        ids = list(ids)
+        if not ids:
+            return []
+        return self._query(
+            f"select {_select(columns)} from inventory where id in ({', '.join('?' * len(ids))}) order by id", ids
+        )
+
+    def get_inventory_item(self, product_id):
+        rows = self._query("select * from inventory where id = ?", (product_id,))
+        return rows[0] if rows else None
+
+    def insert_inventory(self, rows):
+        return self._insert('inventory', rows)
+
+    def update_inventory(self, product_id, values):
+        columns = list(values)
+        self._execute(
+            f"update inventory set {', '.join(f'{c} = ?' for c in columns)} where id = ?",
+            [values[c] for c in columns] + [product_id],
+        )
+
+    def update_inventory_many(self, updates):
+        with self._lock, self.conn:
+            self._update_inventory_rows(updates)
+
+    def list_sales(self, columns=None, after_id=None):
+        if after_id is None:
+            return self._query(f"select {_select(columns)} from sales order by id")
+        return self._query(f"select {_select(columns)} from sales where id > ? order by id", (after_id,))
+
+    def last_sale_id(self):
+        return self._query("select max(id) as id from sales")[0]['id']
+
+    def list_sales_page(self, limit, before=None, product_id=None, start=None, end=None):
+        conditions, params = [], []
+        if product_id is not None:
+            conditions.append("s.product_id = ?")
+            params.append(product_id)
+        if start is not None:
+            conditions.append("s.timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("s.timestamp < ?")
+            params.append(end)
+        if before is not None:
+            conditions.append("(s.timestamp, s.id) < (?, ?)")
+            params.extend(before)
+        where = f"where {' and '.join(conditions)}" if conditions else ""
+        rows = self._query(
+            "select s.*, i.name as _name, i.sku as _sku from sales s left join inventory i on i.id = s.product_id "
+            f"{where} order by s.timestamp desc, s.id desc limit ?",
+            params + [limit],
+        )
+        for row in rows:
+            row['inventory'] = {'name': row.pop('_name'), 'sku': row.pop('_sku')}
+        return rows
+
+    def list_daily_sales(self, since=None, until=None):
+        # Timestamps are ISO strings, so the day is their first 10 characters
+        # and comparing against a bare date selects whole days
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        where = f"where {' and '.join(conditions)}" if conditions else ""
+        return self._query(
+            "select product_id, substr(timestamp, 1, 10) as day, total(quantity) as quantity, "
+            "total(sale_price) as price_sum, count(sale_price) as price_count, count(*) as sales, "
+            f"max(id) as last_id from sales {where} group by product_id, day order by product_id, day",
+            params,
+        )
+
+    def list_sales_history(self, before):
+        return self._query(
+            """
+            with daily as (
+                select product_id, substr(timestamp, 1, 10) as day, total(sale_price) as price_sum,
+                       count(sale_price) as price_count
+                from sales where timestamp < ? group by product_id, day
+            ),
+            firsts as (
+                select product_id, substr(min(timestamp), 1, 10) as first_day from sales group by product_id
+            )
+            select f.product_id, f.first_day, p.day, p.price_sum, p.price_count
+            from firsts f left join daily p on p.product_id = f.product_id and p.day = (
+                select max(day) from daily d where d.product_id = f.product_id and d.price_count > 0 and d.price_sum != 0
+            )
+            """,
+            (before,),
+        )
+
+    def count_sales(self):
+        return self._query("select count(*) as n from sales")[0]['n']
+
+    def insert_sales(self, rows):
+        return self._insert('sales', rows)
+
+    def record_sales(self, rows, stock_updates):
+        with self._lock, self.conn:
+            inserted = self._insert_rows('sales', rows)
+            self._update_inventory_rows(stock_updates)
+        return self._select_inserted('sales', inserted)
+
+    def delete_all_sales(self):
+        self._execute("delete from sales")
+
+    def replace_dashboard_stats(self, stats):
+        with self._lock, self.conn:
+            self.conn.execute("delete from dashboard_stats")
+            columns = list(stats)
+            self.conn.execute(
+                f"insert into dashboard_stats ({', '.join(columns)}) values ({', '.join('?' * len(columns))})",
+                [stats[c] for c in columns],
+            )
+
+    def insert_recommendations(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"insert into ai_recommendations ({', '.join(columns)}) values ({', '.join('?' * len(columns))})",
+                [[row.get(c) for c in columns] for row in rows],
+            )
+
+    def list_recommendations(self, snapshot_id, columns=None, with_products=False):
+        if not with_products:
+            return self._query(
+                f"select {_select(columns)} from ai_recommendations where snapshot_id = ? order by id", (snapshot_id,)
+            )
+        select = 'r.*' if columns is None else ', '.join(f'r.{c}' for c in columns)
+        rows = self._query(
+            f"select {select}, i.name as _name, i.sku as _sku, i.supplier as _supplier "
+            "from ai_recommendations r left join inventory i on i.id = r.product_id "
+            "where r.snapshot_id = ? order by r.id",
+            (snapshot_id,),
+        )
+        for row in rows:
+            row['inventory'] = {'name': row.pop('_name'), 'sku': row.pop('_sku'), 'supplier': row.pop('_supplier')}
+        return rows
+
+    def insert_recommendation_snapshot(self, snapshot):
+        self._insert('ai_recommendation_snapshots', [snapshot])
+
+    def latest_recommendation_snapshots(self, limit):
+        rows = self._query(
+            "select snapshot_id from ai_recommendation_snapshots order by created_at desc limit ?", (limit,)
+        )
+        return [row['snapshot_id'] for row in rows]
+
+    def delete_recommendation_snapshots_except(self, keep_ids):
+        keep_ids = list(keep_ids)
+        marks = ', '.join('?' * len(keep_ids))
+        with self._lock, self.conn:
+            self.conn.execute(f"delete from ai_recommendations where snapshot_id not in ({marks})", keep_ids)
+            self.conn.execute(f"delete from ai_recommendation_snapshots where snapshot_id not in ({marks})", keep_ids)
+
+
+# Table and operation of each Storage method, for the query metrics
+STORAGE_OPERATIONS = {
+    'list_inventory': ('inventory', 'select'),
+    'get_inventory_item': ('inventory', 'select'),
+    'insert_inventory': ('inventory', 'insert'),
+    'update_inventory': ('inventory', 'update'),
+    'update_inventory_many': ('inventory', 'update_many'),
+    'list_sales': ('sales', 'select'),
+    'list_sales_page': ('sales', 'select_page'),
+    'last_sale_id': ('sales', 'max_id'),
+    'list_daily_sales': ('sales', 'select_daily'),
+    'list_sales_history': ('sales', 'select_history'),
+    'count_sales': ('sales', 'count'),
+    'insert_sales': ('sales', 'insert'),
+    'record_sales': ('sales', 'insert_with_stock'),
+    'delete_all_sales': ('sales', 'delete'),
+    'replace_dashboard_stats': ('dashboard_stats', 'replace'),
+    'insert_recommendations': ('ai_recommendations', 'insert'),
+    'list_recommendations': ('ai_recommendations', 'select'),
+    'insert_recommendation_snapshot': ('ai_recommendation_snapshots', 'insert'),
+    'latest_recommendation_snapshots': ('ai_recommendation_snapshots', 'select'),
+    'delete_recommendation_snapshots_except': ('ai_recommendation_snapshots', 'delete'),
+}
+
+QUERY_SECONDS = REGISTRY.histogram(
+    'stocksense_storage_query_duration_seconds', 'Storage query latency by table.', ['backend', 'table', 'operation']
+)
+QUERY_ROWS = REGISTRY.histogram(
+    'stocksense_storage_query_rows', 'Rows returned by storage queries.', ['backend', 'table', 'operation'], ROW_BUCKETS
+)
+QUERY_ERRORS = REGISTRY.counter(
+    'stocksense_storage_query_errors_total', 'Storage queries that raised.', ['backend', 'table', 'operation']
+)
+
+
+class InstrumentedStorage:
+    """Wraps a Storage and records latency and row counts of every query."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.backend = type(storage).__name__.replace('Storage', '').lower()
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+        if name not in STORAGE_OPERATIONS:
+            return method
+        labels = (self.backend,) + STORAGE_OPERATIONS[name]
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                QUERY_ERRORS.inc(*labels)
+                raise
+            finally:
+                QUERY_SECONDS.observe(time.perf_counter() - started, *labels)
+            if isinstance(result, list):
+                QUERY_ROWS.observe(len(result), *labels)
+            return result
+
+        return timed
+
+
+def create_storage():
+    """Storage backend selected by the STORAGE_BACKEND environment variable.
+
+    ``supabase`` (default) uses SUPABASE_URL/SUPABASE_KEY; ``sqlite`` uses
+    SQLITE_PATH (``stock_sense.db`` by default, ``:memory:`` for in-memory).
+    Queries are timed through InstrumentedStorage.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "supabase").lower()
+    if backend == "supabase":
+        return InstrumentedStorage(SupabaseStorage(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")))
+    if backend == "sqlite":
+        return InstrumentedStorage(SQLiteStorage(os.getenv("SQLITE_PATH", "stock_sense.db")))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -1,25 +1,19 @@
-from supabase import create_client, Client
 from ml_inventory_model import ml_model
-import os
 from dotenv import load_dotenv
+from storage import create_storage
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+storage = create_storage()
 
 def test_recommendations():
     print("=== TESTING RECOMMENDATIONS ===")
     
     # Get data
-    inventory_response = supabase.table('inventory').select('*').execute()
-    inventory = inventory_response.data
+    inventory = storage.list_inventory()
     print(f"Inventory items: {len(inventory)}")
     
-    sales_response = supabase.table('sales').select('*').execute()
-    sales = sales_response.data
+    sales = storage.list_sales()
     print(f"Sales records: {len(sales)}")
     
     # Check if model is trained
@@ -0,0 +1,216 @@
+"""Rolling-origin cross-validated hyperparameter search for the demand model.
+
+    python tune_model.py --n-estimators 25,50,100 --max-depth none,8,16 --window-caps 14,30
+    python tune_model.py --folds 4 --fold-days 14 --jobs 4 --dry-run
+
+Training windows are built once per window cap and held in memory; joblib
+hands them to the worker processes as read-only memory-mapped files. Each
+fold trains on the windows whose target days all precede it and validates
+on its next --fold-days days, so no future day leaks into training. Every
+(candidate, fold) pair is an independent task spread over --jobs processes.
+The cheapest candidate within --tolerance of the best mean MAE is saved to
+MODEL_CONFIG_PATH, where InventoryMLModel picks it up for the next training.
+"""
+import argparse
+import itertools
+import pickle
+import time
+from datetime import datetime
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.preprocessing import StandardScaler
+
+from estimators import MODEL_CONFIG_PATH, make_estimator, save_model_config, serving_estimator
+from feature_engine import MAX_WINDOW, training_target_days
+
+DEFAULT_N_ESTIMATORS = "25,50,100"
+DEFAULT_MAX_DEPTH = "none,8,16"
+DEFAULT_WINDOW_CAPS = "14,30"
+
+
+def parse_grid(text, cast=int):
+    """Comma-separated values, ``none`` standing for None."""
+    return [None if value.strip().lower() == "none" else cast(value) for value in text.split(",")]
+
+
+def rolling_origin_folds(target_days, n_folds, fold_days, horizon=1):
+    """Validation blocks of ``fold_days`` days ending at the last target day, oldest first.
+
+    Each fold is a dict of ISO dates: validation covers ``val_start <=
+    day < val_end`` and training the rows whose ``horizon`` target days all
+    fall before ``val_start``. Folds without training rows are dropped.
+    """
+    if not len(target_days):
+        return []
+    last_day = np.max(target_days)
+    folds = []
+    for k in range(n_folds, 0, -1):
+        val_start = last_day - k * fold_days + 1
+        if (target_days + (horizon - 1) < val_start).any():
+            folds.append({"val_start": str(val_start), "val_end": str(val_start + fold_days)})
+    return folds
+
+
+def evaluate_fold(features, targets, target_days, fold, backend, params, horizon):
+    """Fit one candidate on a fold's training rows and score it on its validation rows."""
+    val_start = np.datetime64(fold["val_start"], "D")
+    val_end = np.datetime64(fold["val_end"], "D")
+    train = np.flatnonzero(target_days + (horizon - 1) < val_start)
+    validation = np.flatnonzero((target_days >= val_start) & (target_days < val_end))
+    if not len(validation):
+        return None
+
+    estimator = make_estimator(backend, multi_output=horizon > 1, params=params)
+    # Candidates already run in parallel, so each fit stays on one core
+    if "n_jobs" in estimator.get_params():
+        estimator.set_params(n_jobs=1)
+    scaler = StandardScaler()
+    started = time.perf_counter()
+    estimator.fit(scaler.fit_transform(features[train]), np.asarray(targets[train], dtype=np.float64))
+    fit_seconds = time.perf_counter() - started
+
+    served = serving_estimator(estimator)
+    actual = np.asarray(targets[validation], dtype=np.float64)
+    predicted = served.predict(scaler.transform(features[validation]))
+    return {
+        "mae": float(mean_absolute_error(actual, predicted)),
+        "r2": float(r2_score(actual, predicted)),
+        "fit_seconds": fit_seconds,
+        "train_rows": len(train),
+        "validation_rows": len(validation),
+        "model_bytes": len(pickle.dumps(served, protocol=pickle.HIGHEST_PROTOCOL)),
+    }
+
+
+def candidate_grid(backend, grid, window_caps):
+    """(params, window cap) candidates, keeping only the hyperparameters ``backend`` has."""
+    accepted = make_estimator(backend).get_params()
+    names = [name for name in grid if name in accepted]
+    skipped = [name for name in grid if name not in accepted]
+    if skipped:
+        print(f"{backend} has no {', '.join(skipped)}; not searched")
+    candidates = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        for window_cap in window_caps:
+            candidates.append((dict(zip(names, values)), window_cap))
+    return candidates
+
+
+def tune(model, sales_data, inventory_data, candidates, n_folds=4, fold_days=14, n_jobs=-1):
+    """Cross-validate every candidate and return one summary per candidate, best mean MAE first."""
+    horizon = model.horizon
+    series = model.daily_series(sales_data)
+    data = {}
+    tasks = []
+    for index, (params, window_cap) in enumerate(candidates):
+        if window_cap not in data:
+            # Built once per cap and shared by every candidate and fold. Not
+            # through the feature store: it prunes to its last few entries,
+            # which would delete earlier caps' files before the workers open them
+            features, targets = model.prepare_features(
+                sales_data, inventory_data, use_store=False, window_cap=window_cap
+            )
+            target_days = training_target_days(series, inventory_data, horizon, window_cap)
+            data[window_cap] = (features, targets, target_days, rolling_origin_folds(target_days, n_folds, fold_days, horizon))
+        features, targets, target_days, folds = data[window_cap]
+        for fold in folds:
+            tasks.append((index, (features, targets, target_days, fold, model.backend, params, horizon)))
+
+    print(f"Evaluating {len(candidates)} candidates on {n_folds} folds ({len(tasks)} fits)...")
+    outcomes = Parallel(n_jobs=n_jobs)(delayed(evaluate_fold)(*arguments) for _, arguments in tasks)
+
+    scores = {}
+    for (index, _), outcome in zip(tasks, outcomes):
+        if outcome is not None:
+            scores.setdefault(index, []).append(outcome)
+    results = []
+    for index, folds in scores.items():
+        params, window_cap = candidates[index]
+        mae = [fold["mae"] for fold in folds]
+        results.append({
+            "params": params,
+            "window_cap": window_cap,
+            "folds": len(folds),
+            "mae": float(np.mean(mae)),
+            "mae_std": float(np.std(mae)),
+            "r2": float(np.mean([fold["r2"] for fold in folds])),
+            "fit_seconds": float(np.mean([fold["fit_seconds"] for fold in folds])),
+            "model_bytes": int(np.mean([fold["model_bytes"] for fold in folds])),
+        })
+    results.sort(key=lambda result: result["mae"])
+    return results
+
+
+def pick_candidate(results, tolerance):
+    """The smallest model whose mean MAE is within ``tolerance`` (relative) of the best."""
+    if not results:
+        return None
+    bar = results[0]["mae"] * (1 + tolerance)
+    return min((result for result in results if result["mae"] <= bar), key=lambda result: result["model_bytes"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the demand model with rolling-origin cross-validation")
+    parser.add_argument("--backend", help="Estimator backend to tune (default: the model's)")
+    parser.add_argument("--n-estimators", default=DEFAULT_N_ESTIMATORS, help="Comma-separated values")
+    parser.add_argument("--max-depth", default=DEFAULT_MAX_DEPTH, help="Comma-separated values, 'none' for unlimited")
+    parser.add_argument("--window-caps", default=DEFAULT_WINDOW_CAPS, help=f"Comma-separated caps, at most {MAX_WINDOW}")
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--fold-days", type=int, default=14, help="Validation days per fold")
+    parser.add_argument("--jobs", type=int, default=-1, help="Worker processes (-1: all cores)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Accepted relative MAE loss for a smaller model")
+    parser.add_argument("--output", default=MODEL_CONFIG_PATH, help="Where to save the chosen configuration")
+    parser.add_argument("--dry-run", action="store_true", help="Report without saving")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from daily_store import DailySalesStore
+    from ml_inventory_model import InventoryMLModel
+    from sales_loader import SalesLoader
+    from storage import create_storage
+
+    load_dotenv()
+    # Untuned, so the search does not start from a previous result
+    model = InventoryMLModel(backend=args.backend, config={})
+    storage = create_storage()
+    inventory = storage.list_inventory()
+    sales_store = DailySalesStore(path=None)
+    SalesLoader(storage).load(sales_store)
+
+    grid = {"n_estimators": parse_grid(args.n_estimators), "max_depth": parse_grid(args.max_depth)}
+    candidates = candidate_grid(model.backend, grid, parse_grid(args.window_caps))
+    # The untuned defaults are always scored, as the baseline
+    candidates.append(({name: model.demand_model.get_params()[name] for name in candidates[0][0]}, MAX_WINDOW))
+    candidates = list({(repr(sorted(params.items())), cap): (params, cap) for params, cap in candidates}.values())
+
+    results = tune(model, sales_store, inventory, candidates, n_folds=args.folds, fold_days=args.fold_days, n_jobs=args.jobs)
+    if not results:
+        print("Not enough history for any fold")
+        return
+    print(f"\n{'params':<40}{'cap':>5}{'MAE':>9}{'±':>7}{'R²':>8}{'fit s':>8}{'size KB':>10}")
+    for result in results:
+        print(
+            f"{str(result['params']):<40}{result['window_cap']:>5}{result['mae']:>9.3f}{result['mae_std']:>7.3f}"
+            f"{result['r2']:>8.3f}{result['fit_seconds']:>8.2f}{result['model_bytes'] / 1024:>10.0f}"
+        )
+
+    best = pick_candidate(results, args.tolerance)
+    print(f"\nChosen: {best['params']} with window cap {best['window_cap']} (MAE {best['mae']:.3f})")
+    if args.dry_run:
+        return
+    save_model_config({
+        "backend": model.backend,
+        "params": best["params"],
+        "window_cap": best["window_cap"],
+        "horizon": model.horizon,
+        "cv": {key: best[key] for key in ("folds", "mae", "mae_std", "r2", "fit_seconds", "model_bytes")},
+        "fold_days": args.fold_days,
+        "tuned_at": datetime.now().isoformat(),
+    }, args.output)
+    print(f"Saved to {args.output}; the next training run uses it")
+
+
+if __name__ == "__main__":
+    main()